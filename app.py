@@ -1,97 +1,1027 @@
 import os
+import codecs
+import posixpath
+import cProfile
+import gzip
+import json
 import time
+import hashlib
+import random
+import re
+import socket
+import sqlite3
+import threading
 import requests
 import sys
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import date, datetime, timedelta, timezone
-from flask import Flask, render_template_string, jsonify
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from bisect import bisect_left
+from flask import Flask, Response, abort, g, has_request_context, request
 
-app = Flask(__name__)
+try:
+    import brotli   # необязательно: если установлен, отдаём br вместо gzip
+except ImportError:
+    brotli = None
+
+# Статику отдаёт свой маршрут /assets (адреса с хэшем, см. «Статические файлы»)
+app = Flask(__name__, static_folder=None)
 
 # ==== Конфиг ====
-ACCOUNT_NAME = "poka-net3"
-POSTER_TOKEN = os.getenv("POSTER_TOKEN")           # обязателен
+ACCOUNT_NAME = os.getenv("ACCOUNT_NAME", "poka-net3")
+POSTER_TOKEN = os.getenv("POSTER_TOKEN")           # обязателен, если заведение одно
 CHOICE_TOKEN = os.getenv("CHOICE_TOKEN")           # опционален (бронирования)
 WEATHER_KEY = os.getenv("WEATHER_KEY", "")         # API ключ OpenWeather
 
-# Категории POS ID
+# Список заведений сети (см. config.json.example). Если файла нет,
+# работаем с одним заведением ACCOUNT_NAME и токенами из переменных.
+ACCOUNTS_CONFIG = os.getenv("ACCOUNTS_CONFIG", "config.json")
+
+# Адреса внешних API (переопределяются, например, для бенчмарка с локальной заглушкой).
+# {account} в адресе Poster заменяется именем заведения.
+POSTER_API_URL = os.getenv("POSTER_API_URL", "https://{account}.joinposter.com/api")
+WEATHER_URL = os.getenv("WEATHER_URL", "https://api.openweathermap.org/data/2.5/weather")
+CHOICE_URL = os.getenv("CHOICE_URL", "https://api.choice.com/bookings/list")
+
+# Категории POS ID (по умолчанию для заведений без своих настроек)
 HOT_CATEGORIES  = {4, 13, 15, 46, 33}
 COLD_CATEGORIES = {7, 8, 11, 16, 18, 19, 29, 32, 36, 44}
 BAR_CATEGORIES  = {9,14,27,28,34,41,42,47,22,24,25,26,39,30}
 
-# Кэш
-PRODUCT_CACHE = {}
-PRODUCT_CACHE_TS = 0
-CACHE = {
-    "hot": {}, "cold": {}, "hot_prev": {}, "cold_prev": {},
-    "hourly": {}, "hourly_prev": {}, "share": {}
+# Периодичность фонового обновления источников, сек
+REFRESH_SALES_SEC = int(os.getenv("REFRESH_SALES_SEC", 60))          # продажи за сегодня
+REFRESH_PREV_SEC = int(os.getenv("REFRESH_PREV_SEC", 86400))         # неделя назад
+REFRESH_WEATHER_SEC = int(os.getenv("REFRESH_WEATHER_SEC", 600))     # погода
+REFRESH_PRODUCTS_SEC = int(os.getenv("REFRESH_PRODUCTS_SEC", 3600))  # справочник товаров
+REFRESH_RETRY_SEC = int(os.getenv("REFRESH_RETRY_SEC", 60))          # повтор после неудачи
+
+# Сравнение с прошлыми неделями: среднее и перцентили по тем же дням
+# недели за BASELINE_WEEKS недель (из сводок закрытых дней)
+BASELINE_WEEKS = int(os.getenv("BASELINE_WEEKS", 4))
+BASELINE_BANDS = (10, 90)
+
+# График продаж: ширина слота по умолчанию (минуты, см. RESOLUTIONS) и часы
+# работы — одни на все дни или по дням недели в config.json (opening_hours)
+CHART_RESOLUTION = int(os.getenv("CHART_RESOLUTION", 60))
+OPENING_HOURS = os.getenv("OPENING_HOURS", "10:00-23:00")
+
+# /api/sales/range: наибольший период в днях; недостающие в архиве дни
+# догружает задача backfill — раз в BACKFILL_SEC не больше BACKFILL_BATCH_DAYS дней
+RANGE_MAX_DAYS = int(os.getenv("RANGE_MAX_DAYS", 366))
+BACKFILL_SEC = int(os.getenv("BACKFILL_SEC", 30))
+BACKFILL_BATCH_DAYS = int(os.getenv("BACKFILL_BATCH_DAYS", 7))
+
+# Архив закрытых дней (SQLite, общий для всех заведений) и снимки
+# справочников товаров ({account} заменяется именем заведения)
+DAY_STORE_PATH = os.getenv("DAY_STORE_PATH", "data/days.sqlite3")
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", "data/catalog-{account}.json")
+
+# Параллельные запросы к внешним API (пулы общие для всех заведений)
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", 8))
+FETCH_POOL = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch")
+# Сколько страниц одного списка Poster запрашивать одновременно
+PAGE_PARALLELISM = int(os.getenv("PAGE_PARALLELISM", 4))
+PAGE_POOL = ThreadPoolExecutor(max_workers=PAGE_PARALLELISM, thread_name_prefix="page")
+
+# Размер страницы списков Poster и куска при потоковом чтении ответа
+POSTER_PER_PAGE = int(os.getenv("POSTER_PER_PAGE", 500))
+JSON_CHUNK_BYTES = int(os.getenv("JSON_CHUNK_BYTES", 16384))
+
+# Микрокэш ответов /api/tables и /api/bookings, сек
+TABLES_TTL_SEC = float(os.getenv("TABLES_TTL_SEC", 10))
+BOOKINGS_TTL_SEC = float(os.getenv("BOOKINGS_TTL_SEC", 30))
+
+# Поток обновлений /api/stream: как часто опрашивать столы и бронирования,
+# пока подключён хотя бы один экран, и интервал пустых «пингов»
+STREAM_TABLES_SEC = float(os.getenv("STREAM_TABLES_SEC", 10))
+STREAM_BOOKINGS_SEC = float(os.getenv("STREAM_BOOKINGS_SEC", 60))
+STREAM_HEARTBEAT_SEC = float(os.getenv("STREAM_HEARTBEAT_SEC", 15))
+
+# Встраивать в страницу готовые снимки продаж, столов и бронирований
+# (первая отрисовка без запросов к API); PRERENDER=0 — пустая страница
+PRERENDER = os.getenv("PRERENDER", "1") == "1"
+
+# Ответы API короче этого порога (байт) не сжимаем
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 512))
+
+# Общий кэш для нескольких процессов: memory или sqlite (см. «Общий кэш
+# между процессами») и срок аренды ведущего процесса, сек
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "data/shared.sqlite3")
+LEADER_LEASE_SEC = float(os.getenv("LEADER_LEASE_SEC", 15))
+
+# Профилирование медленных запросов (включается явно): доля запросов под
+# профилировщиком, порог записи на диск и каталог для .prof файлов.
+# При PROFILE_ENABLED=1 запрос с ?profile=1 профилируется всегда.
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "") == "1"
+PROFILE_SAMPLE = float(os.getenv("PROFILE_SAMPLE", 0.05))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", 500))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+
+# Предохранитель внешних источников: сколько неудачных запросов подряд
+# открывают его и сколько секунд после этого запросы сразу отклоняются
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", 3))
+BREAKER_COOLDOWN_SEC = float(os.getenv("BREAKER_COOLDOWN_SEC", 30))
+
+# HTTP-клиент: таймауты (сек) и повторы
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 25))      # таймаут чтения по умолчанию
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 2))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", 0.5))
+HTTP_RETRY_MAX_WAIT = float(os.getenv("HTTP_RETRY_MAX_WAIT", 30))
+# Таймаут чтения по методам, можно переопределить: HTTP_TIMEOUTS="weather=5,bookings=10"
+ENDPOINT_TIMEOUTS = {
+    "menu.getProducts": 25,
+    "transactions.getTransactions": 25,
+    "dash.getCategoriesSales": 15,
+    "dash.getTransactions": 10,
+    "weather": 10,
+    "bookings": 15,
 }
-CACHE_TS = 0
+for _pair in filter(None, os.getenv("HTTP_TIMEOUTS", "").split(",")):
+    _name, _, _value = _pair.partition("=")
+    ENDPOINT_TIMEOUTS[_name.strip()] = float(_value)
+
+# ===== Метрики =====
+# Простейший реестр в формате Prometheus: счётчики, значения и гистограммы
+# хранятся в словарях под одной блокировкой. Запись — пара операций
+# со словарём, вся работа по форматированию делается только в /metrics.
+METRICS_LOCK = threading.Lock()
+_COUNTERS = {}     # (имя, метки) -> значение
+_GAUGES = {}
+_HISTOGRAMS = {}   # (имя, метки) -> [счётчики по корзинам..., сумма, количество]
+_METRIC_INFO = {}  # имя -> (тип, описание, корзины)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25)
+PAGE_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+def describe(name, kind, text, buckets=None):
+    _METRIC_INFO[name] = (kind, text, buckets)
+
+def inc(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with METRICS_LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with METRICS_LOCK:
+        _GAUGES[key] = value
+
+def observe(name, value, **labels):
+    buckets = _METRIC_INFO[name][2]
+    key = (name, tuple(sorted(labels.items())))
+    idx = bisect_left(buckets, value)
+    with METRICS_LOCK:
+        h = _HISTOGRAMS.get(key)
+        if h is None:
+            h = _HISTOGRAMS[key] = [0] * (len(buckets) + 2)
+        if idx < len(buckets):
+            h[idx] += 1
+        h[-2] += value
+        h[-1] += 1
+
+def _fmt_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+def render_metrics():
+    with METRICS_LOCK:
+        counters, gauges = dict(_COUNTERS), dict(_GAUGES)
+        histograms = {k: list(v) for k, v in _HISTOGRAMS.items()}
+    series = {}
+    for (name, labels), value in list(counters.items()) + list(gauges.items()):
+        series.setdefault(name, []).append(f"{name}{_fmt_labels(labels)} {value}")
+    for (name, labels), h in histograms.items():
+        lines = series.setdefault(name, [])
+        cum = 0
+        for bound, count in zip(_METRIC_INFO[name][2], h):
+            cum += count
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', bound)])} {cum}")
+        lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {h[-1]}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {h[-2]}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {h[-1]}")
+    out = []
+    for name in sorted(series):
+        kind, text, _ = _METRIC_INFO.get(name, ("untyped", "", None))
+        out.append(f"# HELP {name} {text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(series[name])
+    return "\n".join(out) + "\n"
+
+describe("dashboard_upstream_request_seconds", "histogram", "Upstream request latency by endpoint", LATENCY_BUCKETS)
+describe("dashboard_upstream_errors_total", "counter", "Failed upstream requests by endpoint and kind")
+describe("dashboard_upstream_retries_total", "counter", "Retried upstream requests by endpoint")
+describe("dashboard_upstream_bytes_total", "counter", "Upstream response bytes by endpoint")
+describe("dashboard_cache_requests_total", "counter", "Cache lookups by cache and result (hit/miss)")
+describe("dashboard_cache_age_seconds", "gauge", "Seconds since the cache was last refreshed")
+describe("dashboard_cache_entries", "gauge", "Entries held by the cache")
+describe("dashboard_refresh_pages", "histogram", "Upstream pages fetched per refresh by source", PAGE_BUCKETS)
+describe("dashboard_pages_fetched_total", "counter", "Upstream pages fetched by source")
+describe("dashboard_line_items_total", "counter", "Transaction line items aggregated")
+describe("dashboard_job_seconds", "histogram", "Background refresh job duration", LATENCY_BUCKETS)
+describe("dashboard_job_failures_total", "counter", "Background refresh jobs that failed")
+describe("dashboard_job_last_success_timestamp", "gauge", "Unix time of the last successful job run")
+describe("dashboard_http_request_seconds", "histogram", "Handler latency by route", LATENCY_BUCKETS)
+describe("dashboard_http_requests_total", "counter", "Handled requests by route and status")
+describe("dashboard_stream_clients", "gauge", "Connected /api/stream clients")
+describe("dashboard_leader", "gauge", "1 if this process runs the upstream refreshes")
+describe("dashboard_breaker_open", "gauge", "1 while the upstream circuit breaker is open or probing")
+
+def count_pages(acc, source, pages):
+    inc("dashboard_pages_fetched_total", pages, account=acc.name, source=source)
+    observe("dashboard_refresh_pages", pages, account=acc.name, source=source)
+
+# ===== Server-Timing и профилирование =====
+# phase() замеряет участок обработчика и добавляет его в заголовок
+# Server-Timing ответа. Фоновые обновления в запросе не участвуют, поэтому
+# их разбивка по этапам (категории, чеки, самая медленная страница, погода,
+# справочник) запоминается в acc.timings заведения и тоже попадает
+# в заголовок с префиксом bg-.
+
+@contextmanager
+def phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context():
+            g.setdefault("timings", []).append((name, time.perf_counter() - started, None))
+
+def note_timing(acc, source, name, seconds, desc=None):
+    # acc.timings: источник -> {этап: (секунды, описание)}
+    acc.timings.setdefault(source, {})[name] = (seconds, desc)
+
+def add_refresh_timings(acc, *sources):
+    if not has_request_context():
+        return
+    timings = g.setdefault("timings", [])
+    for source in sources:
+        for name, (seconds, desc) in list(acc.timings.get(source, {}).items()):
+            timings.append((f"bg-{source}-{name}", seconds, desc))
+
+def server_timing_header(total):
+    parts = []
+    for name, seconds, desc in g.get("timings", []) + [("total", total, None)]:
+        part = f"{name};dur={seconds * 1000:.1f}"
+        if desc:
+            part += f';desc="{desc}"'
+        parts.append(part)
+    return ", ".join(parts)
+
+def _start_profile():
+    if not PROFILE_ENABLED:
+        return
+    forced = request.args.get("profile") == "1"
+    if not forced and random.random() >= PROFILE_SAMPLE:
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return   # в этом процессе уже работает другой профилировщик
+    g.profiler, g.profile_forced = profiler, forced
+
+def _finish_profile(elapsed):
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return
+    profiler.disable()
+    if elapsed * 1000 < PROFILE_SLOW_MS and not g.get("profile_forced"):
+        return
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    route = route.strip("/").replace("/", "_").replace("<", "").replace(">", "") or "index"
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{route}-{elapsed * 1000:.0f}ms.prof")
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(path)
+        print(f"DEBUG profile saved: {path}", file=sys.stderr, flush=True)
+    except OSError as e:
+        print("ERROR profile save:", e, file=sys.stderr, flush=True)
+
+# ===== HTTP-клиент =====
+# Все запросы к внешним API идут через _get: одна Session с пулом keep-alive
+# соединений на каждый хост, таймауты по методам, повторы с джиттером
+# и счётчики времени/байт по каждому методу.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+_SESSIONS = {}
+_sessions_lock = threading.Lock()
+UPSTREAM_STATS = {}
+_stats_lock = threading.Lock()
+
+def _session(host):
+    sess = _SESSIONS.get(host)
+    if sess is None:
+        with _sessions_lock:
+            sess = _SESSIONS.get(host)
+            if sess is None:
+                sess = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=FETCH_WORKERS + PAGE_PARALLELISM)
+                sess.mount("https://", adapter)
+                sess.mount("http://", adapter)
+                _SESSIONS[host] = sess
+    return sess
+
+def _endpoint_name(url):
+    # Для Poster — имя метода (dash.getTransactions), для остальных — хост
+    parts = urlsplit(url)
+    last = parts.path.rstrip("/").rsplit("/", 1)[-1]
+    return last if "." in last else parts.hostname
+
+def _record(endpoint, seconds, nbytes, error=False, retry=False, kind=None):
+    observe("dashboard_upstream_request_seconds", seconds, endpoint=endpoint)
+    if error:
+        inc("dashboard_upstream_errors_total", endpoint=endpoint, kind=kind or "http")
+    if retry:
+        inc("dashboard_upstream_retries_total", endpoint=endpoint)
+    if nbytes:
+        inc("dashboard_upstream_bytes_total", nbytes, endpoint=endpoint)
+    with _stats_lock:
+        st = UPSTREAM_STATS.get(endpoint)
+        if st is None:
+            st = UPSTREAM_STATS[endpoint] = {
+                "calls": 0, "errors": 0, "retries": 0,
+                "seconds": 0.0, "max_seconds": 0.0, "bytes": 0,
+            }
+        st["calls"] += 1
+        st["errors"] += int(error)
+        st["retries"] += int(retry)
+        st["seconds"] += seconds
+        st["max_seconds"] = max(st["max_seconds"], seconds)
+        st["bytes"] += nbytes
+
+def _retry_after(resp):
+    value = resp.headers.get("Retry-After") if resp is not None else None
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+# Предохранитель по источнику (хост + метод). Каждая неудачная попытка
+# (таймаут, обрыв, 429/5xx) считается; после BREAKER_FAILURES подряд источник
+# признаётся недоступным, и BREAKER_COOLDOWN_SEC секунд запросы к нему сразу
+# завершаются UpstreamUnavailable, не дожидаясь таймаутов. Затем пропускается
+# один пробный запрос без повторов (half-open): удача закрывает предохранитель,
+# неудача открывает его снова.
+class UpstreamUnavailable(requests.ConnectionError):
+    pass
+
+# Poster ответил, но без данных: {"error": ...} с кодом 200, нет поля
+# response или справочник товаров загружен не полностью. Такой результат
+# нельзя принимать за пустой день — его не сохраняем и пробуем позже.
+class PosterError(Exception):
+    pass
+
+def poster_response(body, endpoint):
+    if not isinstance(body, dict) or "error" in body or "response" not in body:
+        error = body.get("error") if isinstance(body, dict) else None
+        raise PosterError(f"{endpoint}: {error or 'no response in body'}")
+    return body["response"]
+
+BREAKERS = {}
+_breakers_lock = threading.Lock()
+
+def _breaker_allow(source):
+    # -> (можно ли идти в сеть, это пробный запрос)
+    now = time.time()
+    with _breakers_lock:
+        br = BREAKERS.setdefault(source, {"state": "closed", "failures": 0, "opened": 0, "probe_ts": 0})
+        if br["state"] == "closed":
+            return True, False
+        if br["state"] == "open" and now - br["opened"] >= BREAKER_COOLDOWN_SEC:
+            br["state"] = "half-open"
+        # Пробный запрос, который так и не вернул результат, не блокирует навсегда
+        if br["state"] == "half-open" and now - br["probe_ts"] >= BREAKER_COOLDOWN_SEC:
+            br["probe_ts"] = now
+            return True, True
+        return False, False
+
+def _breaker_result(source, ok):
+    # -> открыт ли предохранитель после этой попытки
+    with _breakers_lock:
+        br = BREAKERS[source]
+        before = br["state"]
+        if ok:
+            br.update(state="closed", failures=0, probe_ts=0)
+        else:
+            br["failures"] += 1
+            if before == "half-open" or br["failures"] >= BREAKER_FAILURES:
+                br.update(state="open", opened=time.time(), probe_ts=0)
+        state = br["state"]
+    if state != before:
+        print(f"DEBUG breaker {source}: {before} -> {state}", file=sys.stderr, flush=True)
+        set_gauge("dashboard_breaker_open", int(state != "closed"), source=source)
+    return state == "open"
+
+def breaker_states():
+    with _breakers_lock:
+        return {source: br["state"] for source, br in BREAKERS.items()}
+
+def _get(url, params=None, headers=None, endpoint=None, timeout=None, stream=False):
+    # stream=True — тело не читается целиком, его разбирает iter_json
+    endpoint = endpoint or _endpoint_name(url)
+    read_timeout = timeout or ENDPOINT_TIMEOUTS.get(endpoint, HTTP_TIMEOUT)
+    host = urlsplit(url).hostname
+    sess = _session(host)
+
+    source = f"{host}/{endpoint}"
+    allowed, probe = _breaker_allow(source)
+    if not allowed:
+        inc("dashboard_upstream_errors_total", endpoint=endpoint, kind="breaker")
+        raise UpstreamUnavailable(f"{source}: circuit open")
+    retries = 0 if probe else HTTP_RETRIES
+
+    for attempt in range(retries + 1):
+        started = time.time()
+        r, err = None, None
+        try:
+            r = sess.get(url, params=params, headers=headers, stream=stream,
+                         timeout=(HTTP_CONNECT_TIMEOUT, read_timeout))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            err = e
+        elapsed = time.time() - started
+
+        retryable = err is not None or r.status_code in RETRY_STATUSES
+        # Ошибки 4xx — проблема запроса, а не источника
+        opened = _breaker_result(source, not retryable)
+        will_retry = retryable and attempt < retries and not opened
+        nbytes = 0 if r is None or stream else len(r.content)
+        kind = "timeout" if isinstance(err, requests.Timeout) else "connection" if err else "http"
+        _record(endpoint, elapsed, nbytes, kind=kind,
+                error=retryable or (r is not None and r.status_code >= 400), retry=will_retry)
+
+        if r is not None:
+            if stream:
+                log_snippet = f"streaming {r.headers.get('Content-Length', '?')} bytes"
+            else:
+                log_snippet = r.content[:500].decode("utf-8", "replace").replace("\n", " ")
+            print(f"DEBUG GET {url.split('?')[0]} -> {r.status_code} in {elapsed*1000:.0f}ms : {log_snippet}",
+                  file=sys.stderr, flush=True)
+        if not will_retry:
+            if stream and r is not None and r.status_code >= 400:
+                r.close()
+            if err is not None:
+                raise err
+            r.raise_for_status()
+            return r
+
+        if r is not None:
+            r.close()
+        # Экспоненциальная пауза с полным джиттером, Retry-After имеет приоритет
+        wait = _retry_after(r)
+        if wait is None:
+            wait = random.uniform(0, HTTP_BACKOFF * (2 ** attempt))
+        wait = min(wait, HTTP_RETRY_MAX_WAIT)
+        print(f"DEBUG retry {endpoint} in {wait:.1f}s ({err or r.status_code})", file=sys.stderr, flush=True)
+        time.sleep(wait)
+
+def _add_bytes(endpoint, nbytes):
+    inc("dashboard_upstream_bytes_total", nbytes, endpoint=endpoint)
+    with _stats_lock:
+        if endpoint in UPSTREAM_STATS:
+            UPSTREAM_STATS[endpoint]["bytes"] += nbytes
+
+def upstream_stats():
+    with _stats_lock:
+        out = {}
+        for name, st in UPSTREAM_STATS.items():
+            out[name] = dict(st, avg_seconds=round(st["seconds"] / st["calls"], 4) if st["calls"] else 0)
+        return out
+
+# ===== Потоковый разбор JSON =====
+# Большие страницы Poster не держим в памяти целиком: тело читается
+# кусками по JSON_CHUNK_BYTES, и из массива по заданному пути (например,
+# response.data) наружу по одному отдаются элементы. Соседние поля
+# (count, page, error) складываются в словарь meta. В памяти одновременно
+# только текущий кусок и текущий элемент.
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WS = " \t\r\n"
+_JSON_NUMBER_TAIL = set("0123456789.eE+-")
+
+class _JsonStream:
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf, self.pos, self.eof, self.nbytes = "", 0, False, 0
+
+    def _more(self):
+        if self.eof:
+            return False
+        try:
+            chunk = next(self._chunks)
+            self.nbytes += len(chunk)
+            text = self._decoder.decode(chunk)
+        except StopIteration:
+            text = self._decoder.decode(b"", final=True)
+            self.eof = True
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _JSON_WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                raise ValueError("unexpected end of JSON")
+
+    def take(self, expected):
+        ch = self.peek()
+        if ch not in expected:
+            raise ValueError(f"expected {expected!r}, got {ch!r}")
+        self.pos += 1
+        return ch
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                val, end = _JSON_DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._more():
+                    raise
+                continue
+            # Число на границе куска могло обрезаться (в том числе сразу после
+            # "." или "e", тогда raw_decode останавливается раньше конца
+            # буфера) — дочитываем и пробуем снова
+            if (not self.eof and isinstance(val, (int, float)) and not isinstance(val, bool)
+                    and all(self.buf[i] in _JSON_NUMBER_TAIL for i in range(end, len(self.buf)))
+                    and self._more()):
+                continue
+            self.pos = end
+            return val
+
+def _walk_json(st, path, meta, found):
+    # found — ключи пути, которые встретились в теле
+    if not path:
+        st.take("[")
+        if st.peek() == "]":
+            st.pos += 1
+            return
+        while True:
+            yield st.value()
+            if st.take(",]") == "]":
+                return
+
+    st.take("{")
+    if st.peek() == "}":
+        st.pos += 1
+        return
+    while True:
+        key = st.value()
+        st.take(":")
+        if key == path[0]:
+            found.add(key)
+        if key == path[0] and st.peek() == ("{" if len(path) > 1 else "["):
+            yield from _walk_json(st, path[1:], meta, found)
+        else:
+            meta[key] = st.value()
+        if st.take(",}") == "}":
+            return
+
+def iter_json(resp, path, meta):
+    # Тело с error или без path[0] (обычно response) — PosterError после
+    # разбора, уже отданные элементы вызывающий должен отбросить
+    st = _JsonStream(resp.iter_content(chunk_size=JSON_CHUNK_BYTES))
+    found = set()
+    try:
+        if st.peek() == "{":
+            yield from _walk_json(st, path, meta, found)
+        if "error" in meta or path[0] not in found:
+            raise PosterError(f"{_endpoint_name(resp.url)}: {meta.get('error') or 'no response in body'}")
+    finally:
+        _add_bytes(_endpoint_name(resp.url), st.nbytes)
+        resp.close()
 
 # ===== Helpers =====
-def _get(url, **kwargs):
-    r = requests.get(url, timeout=kwargs.pop("timeout", 25))
-    log_snippet = r.text[:500].replace("\n", " ")
-    print(f"DEBUG GET {url.split('?')[0]} -> {r.status_code} : {log_snippet}", file=sys.stderr, flush=True)
-    r.raise_for_status()
-    return r
+def _timed_call(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+def fan_out(calls, timings=None):
+    # calls: {"имя": (функция, аргументы...)} — все вызовы идут параллельно
+    # в FETCH_POOL, время ожидания равно самому медленному из них.
+    # Сами функции не должны снова вызывать fan_out, иначе пул может
+    # заблокироваться на вложенном ожидании.
+    # timings — необязательный словарь, куда пишется время каждого вызова.
+    futures = {name: FETCH_POOL.submit(_timed_call, fn, *args) for name, (fn, *args) in calls.items()}
+    out = {}
+    for name, f in futures.items():
+        out[name], seconds = f.result()
+        if timings is not None:
+            timings[name] = seconds
+    return out
+
+# Склейка одинаковых запросов: пока один поток ходит во внешний API,
+# остальные ждут его результат, а не делают свой запрос. Готовый результат
+# ещё ttl секунд отдаётся из памяти, так что нагрузка на Poster не зависит
+# от числа открытых экранов. Результаты хранятся отдельно по заведениям
+# (acc.flights), а при общем CACHE_STORE склеиваются и между процессами.
+# Если fn() вернула None (источник не ответил), ещё ttl секунд отдаётся
+# последний удачный результат, а запись помечается устаревшей (stale) —
+# её время попадает в acc.cache["stale"].
+def single_flight(acc, key, ttl, fn):
+    entry = acc.flights.setdefault(key, {"value": None, "ts": 0, "good": 0, "stale": False,
+                                         "lock": threading.Lock()})
+    arrived = time.time()
+    if entry["ts"] and arrived - entry["ts"] < ttl:
+        inc("dashboard_cache_requests_total", account=acc.name, cache=key, result="hit")
+        return entry["value"]
+    with entry["lock"]:
+        # Пока ждали блокировку, соседний поток мог уже всё загрузить
+        if entry["ts"] >= arrived or (entry["ts"] and time.time() - entry["ts"] < ttl):
+            inc("dashboard_cache_requests_total", account=acc.name, cache=key, result="hit")
+            return entry["value"]
+        shared_key = f"{acc.name}/{key}"
+        with CACHE_STORE.lock(shared_key):
+            # ...или соседний процесс
+            found = CACHE_STORE.get(shared_key, since=time.time() - ttl)
+            if found is not None:
+                inc("dashboard_cache_requests_total", account=acc.name, cache=key, result="hit")
+                value, ts = found
+            else:
+                inc("dashboard_cache_requests_total", account=acc.name, cache=key, result="miss")
+                value, ts = fn(), time.time()
+                if value is not None:
+                    CACHE_STORE.put(shared_key, value, ts)
+        stale = value is None
+        if not stale:
+            entry["value"], entry["good"] = value, ts
+        entry["ts"] = ts
+        if entry["stale"] != stale:
+            entry["stale"] = stale
+            _rebuild_cache(acc)
+        return entry["value"]
+
+def paginate(fetch_page, start=1, parallelism=None):
+    # fetch_page(page) -> (items, total, per_page); total=None, если API
+    # не сообщает общее количество. Первая страница грузится сразу, остальные —
+    # параллельно в PAGE_POOL (не более parallelism одновременно).
+    # Страницы отдаются строго по порядку.
+    parallelism = max(1, parallelism or PAGE_PARALLELISM)
+    items, total, per_page = fetch_page(start)
+    yield items
+    if not items or len(items) < per_page:
+        return
+
+    if total is not None:
+        last = start + (max(0, total - start * per_page) + per_page - 1) // per_page
+    else:
+        last = None   # читаем наперёд, пока не встретим неполную страницу
+
+    pending = deque()
+    next_page = start + 1
+
+    def submit_more():
+        nonlocal next_page
+        while len(pending) < parallelism and (last is None or next_page <= last):
+            pending.append(PAGE_POOL.submit(fetch_page, next_page))
+            next_page += 1
+
+    submit_more()
+    try:
+        while pending:
+            items = pending.popleft().result()[0]
+            yield items
+            if not items or (last is None and len(items) < per_page):
+                break
+            submit_more()
+    finally:
+        for f in pending:
+            f.cancel()
 
 # ===== Справочник товаров =====
-def load_products():
-    global PRODUCT_CACHE, PRODUCT_CACHE_TS
-    if PRODUCT_CACHE and time.time() - PRODUCT_CACHE_TS < 3600:
-        return PRODUCT_CACHE
-
+# Справочник обновляется фоновой задачей "products" и правится на месте:
+# читатели никогда не видят пустой или подменённый словарь. Вместе с ним
+# поддерживается индекс product_id -> цех (0 — горячий, 1 — холодный,
+# 2 — бар), так что при разборе чеков нужен один поиск по словарю.
+# Снимок справочника лежит на диске и подхватывается при старте.
+# У каждого заведения свой справочник (acc.products) и свой индекс
+# acc.product_station — ключи и int, и str: Poster присылает product_id
+# в обоих видах.
+def station_of(acc, cid):
+    if cid in acc.hot_categories:
+        return 0
+    if cid in acc.cold_categories:
+        return 1
+    if cid in acc.bar_categories:
+        return 2
+    return -1
+
+def load_products(acc, force=False):
+    # Неполный справочник (часть страниц не загрузилась) перегружается
+    # при каждом обращении, пока не загрузится целиком
+    if acc.products and acc.products_complete and not force:
+        inc("dashboard_cache_requests_total", account=acc.name, cache="products", result="hit")
+        return acc.products
+    if not force:
+        inc("dashboard_cache_requests_total", account=acc.name, cache="products", result="miss")
+    # Параллельные задачи не должны грузить справочник дважды
+    with acc.product_lock:
+        if acc.products and acc.products_complete and not force:
+            return acc.products
+        return _load_products(acc)
+
+def product_stations(acc):
+    # С пустым или неполным индексом строки чеков молча потерялись бы
+    load_products(acc)
+    if not acc.products_complete:
+        raise PosterError(f"product catalog is incomplete ({len(acc.products)} items)")
+    return acc.product_station
+
+def _apply_catalog(acc, mapping, complete=True):
+    # Удаляем пропавшие товары только если справочник загружен полностью
+    products, index = acc.products, acc.product_station
+    changed = 0
+    if complete:
+        for pid in [pid for pid in products if pid not in mapping]:
+            del products[pid]
+            index.pop(pid, None)
+            index.pop(str(pid), None)
+            changed += 1
+    for pid, cid in mapping.items():
+        if products.get(pid) == cid:
+            continue
+        products[pid] = cid
+        st = station_of(acc, cid)
+        if st >= 0:
+            index[pid] = st
+            index[str(pid)] = st
+        else:
+            index.pop(pid, None)
+            index.pop(str(pid), None)
+        changed += 1
+    return changed
+
+def _save_catalog_snapshot(acc):
+    path = acc.snapshot_path
+    try:
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"ts": acc.products_ts, "complete": acc.products_complete, "products": acc.products}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"ERROR catalog snapshot save [{acc.name}]:", e, file=sys.stderr, flush=True)
+
+def load_catalog_snapshot(acc):
+    try:
+        with open(acc.snapshot_path) as f:
+            snap = json.load(f)
+        mapping = {int(pid): int(cid) for pid, cid in snap.get("products", {}).items()}
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"ERROR catalog snapshot load [{acc.name}]:", e, file=sys.stderr, flush=True)
+        return False
+    with acc.product_lock:
+        _apply_catalog(acc, mapping)
+        acc.products_ts = float(snap.get("ts", 0))
+        acc.products_complete = bool(mapping) and bool(snap.get("complete", True))
+    print(f"DEBUG products from snapshot [{acc.name}]: {len(acc.products)} items", file=sys.stderr, flush=True)
+    return bool(mapping)
+
+def _load_products(acc):
     mapping = {}
-    per_page = 500
+    complete = True
+    pages = 0
+    per_page = POSTER_PER_PAGE
     for ptype in ("products", "batchtickets"):
-        page = 1
-        while True:
+        def fetch_page(page, ptype=ptype):
+            # Из каждого товара оставляем только пару (product_id, категория).
+            # Битый товар даёт (0, 0), а не пропадает: по длине страницы
+            # paginate решает, последняя ли она
             url = (
-                f"https://{ACCOUNT_NAME}.joinposter.com/api/menu.getProducts"
-                f"?token={POSTER_TOKEN}&type={ptype}&per_page={per_page}&page={page}"
+                f"{acc.poster_api_url}/menu.getProducts"
+                f"?token={acc.poster_token}&type={ptype}&per_page={per_page}&page={page}"
             )
-            try:
-                resp = _get(url)
-                data = resp.json().get("response", [])
-            except Exception as e:
-                print("ERROR load_products:", e, file=sys.stderr, flush=True)
-                break
-
-            if not isinstance(data, list) or not data:
-                break
-
-            for item in data:
+            pairs = []
+            for item in iter_json(_get(url, stream=True), ("response",), {}):
                 try:
-                    pid = int(item.get("product_id", 0))
-                    cid = int(item.get("menu_category_id", 0))
+                    pairs.append((int(item.get("product_id", 0)), int(item.get("menu_category_id", 0))))
+                except Exception:
+                    pairs.append((0, 0))
+            return pairs, None, per_page
+
+        try:
+            for pairs in paginate(fetch_page):
+                pages += 1
+                for pid, cid in pairs:
                     if pid and cid:
                         mapping[pid] = cid
-                except Exception:
-                    continue
+        except Exception as e:
+            complete = False
+            print(f"ERROR load_products [{acc.name}]:", e, file=sys.stderr, flush=True)
+    count_pages(acc, "products", pages)
+
+    # При сбое Poster не затираем рабочий справочник пустым. Полный
+    # справочник, дополненный частичной загрузкой, остаётся полным
+    complete = complete and bool(mapping)
+    changed = _apply_catalog(acc, mapping, complete=complete)
+    acc.products_complete = complete or (acc.products_complete and bool(acc.products))
+    if mapping:
+        acc.products_ts = time.time()
+        if changed:
+            _save_catalog_snapshot(acc)
+    print(f"DEBUG products cached [{acc.name}]: {len(acc.products)} items, {changed} changed",
+          file=sys.stderr, flush=True)
+    return acc.products
+
+# ===== Архив закрытых дней =====
+# Прошедший день уже не меняется: его сводки загружаются из Poster один раз
+# и дальше читаются с диска, в том числе после перезапуска. Архив один
+# на все заведения, строки различаются колонкой account:
+#   rollup_days       — какие дни уже сведены (день без продаж тоже)
+#   rollup_categories — (день, цех, категория) -> количество
+#   rollup_bins       — (день, начало корзины в минутах, цех) -> количество,
+#                       корзины по BIN_MINUTES, без накопления
+#   rollup_queue      — дни, которые запросили через /api/sales/range, а их ещё нет
+_day_store_conn = None
+_day_store_lock = threading.Lock()
+
+def _day_store():
+    global _day_store_conn
+    if _day_store_conn is None:
+        folder = os.path.dirname(DAY_STORE_PATH)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(DAY_STORE_PATH, check_same_thread=False)
+        # Прежние форматы архива (готовые ответы по дням, почасовые сводки) —
+        # только кэш, закрытые дни заново сведутся из Poster
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "closed_days" in tables or "rollup_hours" in tables:
+            conn.executescript(
+                "DROP TABLE IF EXISTS closed_days; DROP TABLE IF EXISTS rollup_hours;"
+                " DROP TABLE IF EXISTS rollup_days; DROP TABLE IF EXISTS rollup_categories;"
+            )
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS rollup_days ("
+            " account TEXT NOT NULL, day TEXT NOT NULL, stored_at REAL NOT NULL,"
+            " PRIMARY KEY (account, day));"
+            "CREATE TABLE IF NOT EXISTS rollup_categories ("
+            " account TEXT NOT NULL, day TEXT NOT NULL, station TEXT NOT NULL,"
+            " category TEXT NOT NULL, qty INTEGER NOT NULL,"
+            " PRIMARY KEY (account, day, station, category));"
+            "CREATE TABLE IF NOT EXISTS rollup_bins ("
+            " account TEXT NOT NULL, day TEXT NOT NULL, minute INTEGER NOT NULL,"
+            " station TEXT NOT NULL, qty INTEGER NOT NULL,"
+            " PRIMARY KEY (account, day, minute, station));"
+            "CREATE TABLE IF NOT EXISTS rollup_queue ("
+            " account TEXT NOT NULL, day TEXT NOT NULL, requested_at REAL NOT NULL,"
+            " PRIMARY KEY (account, day));"
+        )
+        conn.commit()
+        _day_store_conn = conn
+    return _day_store_conn
+
+def _empty_rollup():
+    # sums — {цех: {категория: количество}}, bins — гистограмма дня [цех][корзина]
+    return {"sums": {st: {} for st in STATIONS}, "bins": _empty_bins()}
+
+def rollup_load(acc, days):
+    # {день: сводка} для уже сведённых дней из days, тремя запросами на все дни
+    days = sorted(set(days))
+    if not days:
+        return {}
+    where = f"account = ? AND day IN ({','.join('?' * len(days))})"
+    args = (acc.name, *days)
+    try:
+        with _day_store_lock:
+            conn = _day_store()
+            found = conn.execute(f"SELECT day FROM rollup_days WHERE {where}", args).fetchall()
+            cats = conn.execute(
+                f"SELECT day, station, category, qty FROM rollup_categories WHERE {where}"
+                " ORDER BY category", args).fetchall()
+            bins = conn.execute(f"SELECT day, minute, station, qty FROM rollup_bins WHERE {where}", args).fetchall()
+    except sqlite3.Error as e:
+        print("ERROR day_store read:", e, file=sys.stderr, flush=True)
+        return {}
+    out = {day: _empty_rollup() for (day,) in found}
+    index = {st: i for i, st in enumerate(STATIONS)}
+    for day, st, name, qty in cats:
+        if day in out:
+            out[day]["sums"][st][name] = qty
+    for day, minute, st, qty in bins:
+        if day in out:
+            out[day]["bins"][index[st]][minute // BIN_MINUTES] = qty
+    return out
+
+def rollup_put(acc, day, rollup):
+    cats = [(acc.name, day, st, name, qty)
+            for st, by_name in rollup["sums"].items() for name, qty in by_name.items()]
+    bins = [(acc.name, day, i * BIN_MINUTES, st, qty)
+            for st, by_bin in zip(STATIONS, rollup["bins"]) for i, qty in enumerate(by_bin) if qty]
+    try:
+        with _day_store_lock:
+            conn = _day_store()
+            with conn:
+                conn.execute("DELETE FROM rollup_categories WHERE account = ? AND day = ?", (acc.name, day))
+                conn.execute("DELETE FROM rollup_bins WHERE account = ? AND day = ?", (acc.name, day))
+                conn.executemany(
+                    "INSERT INTO rollup_categories (account, day, station, category, qty)"
+                    " VALUES (?, ?, ?, ?, ?)", cats)
+                conn.executemany(
+                    "INSERT INTO rollup_bins (account, day, minute, station, qty)"
+                    " VALUES (?, ?, ?, ?, ?)", bins)
+                conn.execute(
+                    "INSERT OR REPLACE INTO rollup_days (account, day, stored_at) VALUES (?, ?, ?)",
+                    (acc.name, day, time.time()))
+    except sqlite3.Error as e:
+        print("ERROR day_store write:", e, file=sys.stderr, flush=True)
+
+def rollup_range(acc, first, last, granularity):
+    # Сырые агрегаты за [first, last] для /api/sales/range. Все таблицы
+    # проиндексированы по (account, day), так что читается только сам период.
+    # -> (сведённые дни, [(ключ, цех, количество)], [(цех, категория, количество)])
+    args = (acc.name, first, last)
+    where = "account = ? AND day BETWEEN ? AND ?"
+    if granularity == "hour":
+        sql = (f"SELECT day || printf(' %02d:00', minute / 60), station, SUM(qty) FROM rollup_bins"
+               f" WHERE {where} GROUP BY day, minute / 60, station")
+    else:
+        sql = f"SELECT day, station, SUM(qty) FROM rollup_bins WHERE {where} GROUP BY day, station"
+    with _day_store_lock:
+        conn = _day_store()
+        days = [day for (day,) in conn.execute(f"SELECT day FROM rollup_days WHERE {where} ORDER BY day", args)]
+        rows = conn.execute(sql, args).fetchall()
+        cats = conn.execute(
+            f"SELECT station, category, SUM(qty) FROM rollup_categories WHERE {where}"
+            " GROUP BY station, category ORDER BY category", args).fetchall()
+    return days, rows, cats
+
+def rollup_enqueue(acc, days):
+    try:
+        with _day_store_lock:
+            conn = _day_store()
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO rollup_queue (account, day, requested_at) VALUES (?, ?, ?)",
+                    [(acc.name, day, time.time()) for day in days])
+    except sqlite3.Error as e:
+        print("ERROR day_store write:", e, file=sys.stderr, flush=True)
+
+def rollup_queued(acc, limit):
+    # Самые свежие дни первыми: их чаще смотрят
+    try:
+        with _day_store_lock:
+            rows = _day_store().execute(
+                "SELECT day FROM rollup_queue WHERE account = ? ORDER BY day DESC LIMIT ?",
+                (acc.name, limit)).fetchall()
+    except sqlite3.Error as e:
+        print("ERROR day_store read:", e, file=sys.stderr, flush=True)
+        return []
+    return [day for (day,) in rows]
 
-            if len(data) < per_page:
-                break
-            page += 1
+def rollup_dequeue(acc, days):
+    try:
+        with _day_store_lock:
+            conn = _day_store()
+            with conn:
+                conn.executemany("DELETE FROM rollup_queue WHERE account = ? AND day = ?",
+                                 [(acc.name, day) for day in days])
+    except sqlite3.Error as e:
+        print("ERROR day_store write:", e, file=sys.stderr, flush=True)
 
-    PRODUCT_CACHE = mapping
-    PRODUCT_CACHE_TS = time.time()
-    print(f"DEBUG products cached: {len(PRODUCT_CACHE)} items", file=sys.stderr, flush=True)
-    return PRODUCT_CACHE
+def _target_date(day_offset):
+    return (date.today() - timedelta(days=day_offset)).strftime("%Y-%m-%d")
 
 # ===== Сводные продажи =====
-def fetch_category_sales(day_offset=0):
-    target_date = (date.today() - timedelta(days=day_offset)).strftime("%Y-%m-%d")
-    url = (
-        f"https://{ACCOUNT_NAME}.joinposter.com/api/dash.getCategoriesSales"
-        f"?token={POSTER_TOKEN}&dateFrom={target_date}&dateTo={target_date}"
-    )
+def fetch_category_sales(acc):
     try:
-        resp = _get(url)
-        rows = resp.json().get("response", [])
+        return _fetch_category_sales(acc, _target_date(0))
     except Exception as e:
-        print("ERROR categories:", e, file=sys.stderr, flush=True)
-        return {"hot": {}, "cold": {}, "bar": {}}
+        # None — источник не ответил, остаётся последний удачный снимок
+        print(f"ERROR categories [{acc.name}]:", e, file=sys.stderr, flush=True)
+        return None
+
+def _fetch_category_sales(acc, target_date):
+    url = (
+        f"{acc.poster_api_url}/dash.getCategoriesSales"
+        f"?token={acc.poster_token}&dateFrom={target_date}&dateTo={target_date}"
+    )
+    resp = _get(url)
+    return classify_category_sales(acc, poster_response(resp.json(), "dash.getCategoriesSales"))
 
+def classify_category_sales(acc, rows):
     hot, cold, bar = {}, {}, {}
     for row in rows:
         try:
@@ -101,11 +1031,11 @@ def fetch_category_sales(day_offset=0):
         except Exception:
             continue
 
-        if cid in HOT_CATEGORIES:
+        if cid in acc.hot_categories:
             hot[name] = hot.get(name, 0) + qty
-        elif cid in COLD_CATEGORIES:
+        elif cid in acc.cold_categories:
             cold[name] = cold.get(name, 0) + qty
-        elif cid in BAR_CATEGORIES:
+        elif cid in acc.bar_categories:
             bar[name] = bar.get(name, 0) + qty
 
     hot = dict(sorted(hot.items(), key=lambda x: x[0]))
@@ -113,107 +1043,422 @@ def fetch_category_sales(day_offset=0):
     bar = dict(sorted(bar.items(), key=lambda x: x[0]))
     return {"hot": hot, "cold": cold, "bar": bar}
 
-# ===== Почасовая диаграмма =====
-def fetch_transactions_hourly(day_offset=0):
-    products = load_products()
-    target_date = (date.today() - timedelta(days=day_offset)).strftime("%Y-%m-%d")
-
-    per_page = 500
-    page = 1
-    hours = list(range(10, 23))
-    hot_by_hour = [0] * len(hours)
-    cold_by_hour = [0] * len(hours)
+# ===== Гистограмма продаж по времени =====
+# Чеки за день раскладываются за один проход в гистограмму по BIN_MINUTES
+# минут за все сутки (для каждого цеха). Слоты графика любой ширины из
+# RESOLUTIONS, окно часов работы и накопительные кривые считаются из неё
+# по запросу — без повторной загрузки чеков.
+STATIONS = ("hot", "cold", "bar")
+BIN_MINUTES = 5
+BINS_PER_DAY = 24 * 60 // BIN_MINUTES
+RESOLUTIONS = tuple(m for m in range(BIN_MINUTES, 61, BIN_MINUTES) if 60 % m == 0)
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+if CHART_RESOLUTION not in RESOLUTIONS:
+    raise ValueError(f"CHART_RESOLUTION must be one of {RESOLUTIONS}")
+
+def _empty_bins():
+    return [[0] * BINS_PER_DAY for _ in STATIONS]
+
+def _parse_hours(spec):
+    # "10:00-23:00" -> (600, 1380), минуты от полуночи; закрытие не позже 24:00
+    try:
+        start, end = (int(h) * 60 + int(m) for h, m in (part.split(":") for part in spec.split("-")))
+    except (AttributeError, ValueError):
+        raise ValueError(f"bad opening hours {spec!r}, expected HH:MM-HH:MM")
+    if not 0 <= start < end <= 24 * 60:
+        raise ValueError(f"bad opening hours {spec!r}")
+    return start, end
+
+def parse_opening_hours(spec, default=None):
+    # Строка — одни часы на всю неделю, словарь {"mon": "10:00-23:00", ...} —
+    # по дням, недостающие дни берутся из default.
+    # -> 7 пар (открытие, закрытие), с понедельника
+    if isinstance(spec, dict):
+        unknown = set(spec) - set(WEEKDAYS)
+        if unknown:
+            raise ValueError(f"bad opening hours weekdays {sorted(unknown)}, expected {WEEKDAYS}")
+        return [_parse_hours(spec[d]) if d in spec else default[i] for i, d in enumerate(WEEKDAYS)]
+    return [_parse_hours(spec)] * 7
+
+DEFAULT_OPENING_HOURS = parse_opening_hours(OPENING_HOURS)
+
+def opening_window(acc, day):
+    return acc.opening_hours[day.weekday()]
+
+def chart_series(bins, window, resolution):
+    # Накопительные кривые по слотам resolution минут внутри окна часов
+    # работы (window — пара минут от полуночи). Продажи вне окна на график
+    # не попадают.
+    start, end = window
+    start -= start % resolution
+    per_slot = resolution // BIN_MINUTES
+    first = start // BIN_MINUTES
+    slots = -(-(end - start) // resolution)
+    out = {"labels": [f"{m // 60:02d}:{m % 60:02d}" for m in range(start, start + slots * resolution, resolution)]}
+    for name, by_bin in zip(STATIONS, bins):
+        total, cum = 0, []
+        for i in range(first, first + slots * per_slot, per_slot):
+            total += sum(by_bin[i:i + per_slot])
+            cum.append(total)
+        out[name] = cum
+    return out
+
+def fetch_transactions_hourly(acc):
+    try:
+        return ingest_transactions_today(acc)
+    except Exception as e:
+        print(f"ERROR transactions [{acc.name}]:", e, file=sys.stderr, flush=True)
+        return None
 
-    while True:
-        url = (
-            f"https://{ACCOUNT_NAME}.joinposter.com/api/transactions.getTransactions"
-            f"?token={POSTER_TOKEN}&date_from={target_date}&date_to={target_date}"
-            f"&per_page={per_page}&page={page}"
-        )
+def _transactions_page(acc, target_date, page, per_page, stations, after=None, counted=(), known=None):
+    # Чеки страницы разбираются потоково прямо в колонки LineBatch,
+    # целиком страница в памяти не собирается
+    url = (
+        f"{acc.poster_api_url}/transactions.getTransactions"
+        f"?token={acc.poster_token}&date_from={target_date}&date_to={target_date}"
+        f"&per_page={per_page}&page={page}"
+    )
+    meta = {}
+    started = time.perf_counter()
+    batch = flatten_lines(iter_json(_get(url, stream=True), ("response", "data"), meta),
+                          stations, after, counted, known)
+    batch.page, batch.seconds = page, time.perf_counter() - started
+    total = int(meta.get("count", 0) or 0)
+    page_info = meta.get("page") or {}
+    per_page_resp = int(page_info.get("per_page", per_page) or per_page)
+    return batch, total, per_page_resp
+
+# ===== Агрегация чеков =====
+# Страница чеков раскладывается в плоские типизированные массивы
+# (минута закрытия, цех, количество), после чего суммы по всем цехам
+# считаются за один проход. Всё, что можно, посчитано заранее:
+# product_id -> цех (acc.product_station, без проверок по трём множествам),
+# минута дня как целое (без strptime) — корзина гистограммы одним делением,
+# строковое количество "2.0" -> 2 (без int(float()) на каждой строке).
+
+class LineBatch:
+    # Колонки строк чеков одной страницы. len() — число прочитанных чеков
+    # (нужно paginate). При загрузке с водяным знаком: counted — ключи
+    # учтённых чеков, blocked_key/blocked_row — самый ранний чек с товаром
+    # не из справочника и его номер на странице
+    __slots__ = ("minutes", "station", "qty", "rows", "counted", "blocked_key", "blocked_row",
+                 "page", "seconds")
+
+    def __init__(self):
+        self.minutes, self.station, self.qty = array("h"), array("b"), array("l")
+        self.rows, self.counted = 0, set()
+        self.blocked_key, self.blocked_row = None, None
+        self.page, self.seconds = 0, 0.0
+
+    def __len__(self):
+        return self.rows
+
+def flatten_lines(items, stations, after=None, counted=(), known=None):
+    # after — водяной знак: чеки с ключом не новее него, а также из counted
+    # (учтённые раньше чеки новее знака) пропускаются. known — все товары
+    # справочника: чек с товаром не из него целиком откладывается до
+    # следующего прохода, а не теряется
+    batch = LineBatch()
+    minutes, station, qty = batch.minutes, batch.station, batch.qty
+    qty_of = {}
+    for trx in items:
+        batch.rows += 1
+        if after is not None:
+            key = _trx_key(trx)
+            if key <= after or key in counted:
+                continue
+        dt_str = trx.get("date_close")
         try:
-            resp = _get(url)
-            body = resp.json().get("response", {})
-            items = body.get("data", []) or []
-            total = int(body.get("count", 0))
-            page_info = body.get("page", {}) or {}
-            per_page_resp = int(page_info.get("per_page", per_page) or per_page)
-        except Exception as e:
-            print("ERROR transactions:", e, file=sys.stderr, flush=True)
-            break
-
-        if not items:
-            break
+            minute = int(dt_str[11:13]) * 60 + int(dt_str[14:16])
+        except (TypeError, ValueError):
+            minute = -1
+        if not 0 <= minute < 1440:
+            if after is not None:
+                batch.counted.add(key)
+            continue
 
-        for trx in items:
-            dt_str = trx.get("date_close")
-            try:
-                dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S")
-                hour = dt.hour
-                if hour not in hours:
-                    continue
-                idx = hours.index(hour)
-            except Exception:
+        start = len(qty)
+        for p in trx.get("products") or ():
+            st = stations.get(p.get("product_id"))
+            if st is None:
+                if known is not None and _product_id(p.get("product_id")) not in known:
+                    break
                 continue
-
-            for p in trx.get("products", []) or []:
+            num = p.get("num", 0)
+            q = qty_of.get(num)
+            if q is None:
                 try:
-                    pid = int(p.get("product_id", 0))
-                    qty = int(float(p.get("num", 0)))
-                except Exception:
-                    continue
-                cid = products.get(pid, 0)
-                if cid in HOT_CATEGORIES:
-                    hot_by_hour[idx] += qty
-                elif cid in COLD_CATEGORIES:
-                    cold_by_hour[idx] += qty
-
-        if per_page_resp * page >= total:
-            break
-        page += 1
-
-    hot_cum, cold_cum = [], []
-    th, tc = 0, 0
-    for h, c in zip(hot_by_hour, cold_by_hour):
-        th += h; tc += c
-        hot_cum.append(th)
-        cold_cum.append(tc)
-
-    labels = [f"{h:02d}:00" for h in hours]
-    return {"labels": labels, "hot": hot_cum, "cold": cold_cum}
+                    q = int(float(num))
+                except (TypeError, ValueError):
+                    q = 0
+                qty_of[num] = q
+            minutes.append(minute)
+            station.append(st)
+            qty.append(q)
+        else:
+            if after is not None:
+                batch.counted.add(key)
+            continue
+        # Товара нет в справочнике: уже разложенные строки чека убираем
+        del minutes[start:], station[start:], qty[start:]
+        if batch.blocked_key is None or key < batch.blocked_key:
+            batch.blocked_key = key
+        if batch.blocked_row is None:
+            batch.blocked_row = batch.rows - 1
+    return batch
+
+def _product_id(pid):
+    try:
+        return int(pid)
+    except (TypeError, ValueError):
+        return None
+
+def bucket_lines(batch, bins):
+    # bins — гистограмма дня [hot[], cold[], bar[]] по BIN_MINUTES, дополняется на месте
+    inc("dashboard_line_items_total", len(batch.qty))
+    for m, st, q in zip(batch.minutes, batch.station, batch.qty):
+        bins[st][m // BIN_MINUTES] += q
+    return bins
+
+def _fetch_day_bins(acc, target_date):
+    stations = product_stations(acc)
+    bins = _empty_bins()
+
+    fetch_page = lambda page: _transactions_page(acc, target_date, page, POSTER_PER_PAGE, stations)
+    pages = 0
+    for batch in paginate(fetch_page):
+        pages += 1
+        bucket_lines(batch, bins)
+    count_pages(acc, "transactions_day", pages)
+
+    return bins
+
+# ===== Инкрементальная загрузка за сегодня =====
+# Вместо полного обхода всех страниц дня помним водяной знак — ключ
+# (date_close, transaction_id), до которого включительно все чеки учтены, —
+# и число уже прочитанных строк. Poster отдаёт чеки по возрастанию времени
+# закрытия, поэтому новые строки оказываются в хвосте: начинаем со страницы,
+# где остановились, и добавляем в суммы только чеки новее водяного знака.
+# Чек с товаром, которого ещё нет в справочнике, не учитывается, и знак
+# не переходит через него: следующий проход прочитает его снова (справочник
+# к тому времени мог обновиться). Учтённые чеки новее знака помнятся
+# в counted, чтобы не сложить их дважды. На случай, если порядок всё же
+# нарушится, раз в INGEST_FULL_RESYNC_SEC день пересчитывается целиком. Состояние (acc.ingest) своё у каждого заведения и сбрасывается
+# при смене даты.
+INGEST_FULL_RESYNC_SEC = int(os.getenv("INGEST_FULL_RESYNC_SEC", 1800))
+
+def _empty_ingest():
+    return {"date": None, "bins": _empty_bins(), "seen": 0, "watermark": ("", 0), "counted": set(),
+            "synced_ts": 0}
+
+def _trx_key(trx):
+    try:
+        return (trx.get("date_close") or "", int(trx.get("transaction_id", 0)))
+    except (TypeError, ValueError):
+        return (trx.get("date_close") or "", 0)
+
+def ingest_transactions_today(acc):
+    target_date = _target_date(0)
+    state = acc.ingest
+    with acc.ingest_lock:
+        full = (state["date"] != target_date
+                or time.time() - state["synced_ts"] > INGEST_FULL_RESYNC_SEC)
+        if full:
+            bins = _empty_bins()
+            seen, watermark, counted = 0, ("", 0), set()
+        else:
+            # Работаем с копиями: при ошибке на середине состояние не портится
+            bins = [list(by_bin) for by_bin in state["bins"]]
+            seen, watermark, counted = state["seen"], state["watermark"], set(state["counted"])
+
+        stations = product_stations(acc)
+        known = acc.products
+        per_page = POSTER_PER_PAGE
+        page = seen // per_page + 1
+        consumed = (page - 1) * per_page
+        # Порог фиксирован на весь проход: страницы идут параллельно
+        after, skip = watermark, frozenset(counted)
+        fetch_page = lambda p: _transactions_page(acc, target_date, p, per_page, stations, after, skip, known)
+        pages, slowest = 0, None
+        blocked_key, blocked_pos, blocked = None, None, 0
+        for batch in paginate(fetch_page, start=page):
+            pages += 1
+            if slowest is None or batch.seconds > slowest.seconds:
+                slowest = batch
+            consumed += len(batch)
+            bucket_lines(batch, bins)
+            counted |= batch.counted
+            if batch.blocked_key is not None:
+                blocked += 1
+                if blocked_key is None or batch.blocked_key < blocked_key:
+                    blocked_key = batch.blocked_key
+                if blocked_pos is None:
+                    blocked_pos = (batch.page - 1) * per_page + batch.blocked_row
+        count_pages(acc, "transactions_today", pages)
+        if slowest is not None:
+            note_timing(acc, "transactions_today", "slowest-page", slowest.seconds,
+                        f"page {slowest.page}, {pages} fetched")
+
+        # Знак — до самого позднего учтённого чека раньше первого отложенного
+        done = [key for key in counted if blocked_key is None or key < blocked_key]
+        if done:
+            watermark = max(watermark, max(done))
+        counted = {key for key in counted if key > watermark}
+        if blocked_key is None:
+            seen = max(seen, consumed)
+        else:
+            seen = min(max(seen, consumed), blocked_pos)
+            print(f"DEBUG transactions [{acc.name}]: unknown products on {blocked} page(s),"
+                  f" held back from {blocked_key}", file=sys.stderr, flush=True)
+
+        state.update({
+            "date": target_date, "bins": bins,
+            "seen": seen, "watermark": watermark, "counted": counted,
+        })
+        if full:
+            state["synced_ts"] = time.time()
+        # Следующий проход работает с копией, так что гистограмму можно отдать как есть
+        return bins
+
+# ===== Сводки закрытых дней и базовая линия =====
+# Неделя назад и среднее за несколько недель считаются в памяти из сводок
+# архива; из Poster загружаются только дни, которых там ещё нет — обычно
+# один новый день в сутки.
+def closed_day_rollups(acc, days):
+    # Сводки закрытых дней: что есть — из архива, остальное — из Poster
+    # (сразу в архив). Дни, которые загрузить не удалось, в ответ не попадают.
+    out = rollup_load(acc, days)
+    inc("dashboard_cache_requests_total", len(out), account=acc.name, cache="day_store", result="hit")
+    for day in sorted(set(days) - set(out), reverse=True):
+        inc("dashboard_cache_requests_total", account=acc.name, cache="day_store", result="miss")
+        try:
+            res = fan_out({"sums": (_fetch_category_sales, acc, day),
+                           "bins": (_fetch_day_bins, acc, day)})
+        except Exception as e:
+            print(f"ERROR rollup {day} [{acc.name}]:", e, file=sys.stderr, flush=True)
+            continue
+        rollup_put(acc, day, res)
+        out[day] = res
+    return out
+
+def _percentile(ordered, q):
+    # Линейная интерполяция между соседними значениями отсортированного списка
+    pos = (len(ordered) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+def _avg(total, n):
+    # Целое среднее — целым числом: в таблице «12», а не «12.0», как и у JS
+    value = round(total / n, 1)
+    return int(value) if value == int(value) else value
+
+def sales_baseline(rollups, window, resolution):
+    # rollups — сводки тех же дней недели за прошлые недели. Среднее по
+    # категориям и по накопительной кривой, плюс полоса перцентилей
+    # BASELINE_BANDS для каждого слота графика
+    n = len(rollups)
+    out = {"weeks": n}
+    if not n:
+        return out
+    for st in STATIONS:
+        names = sorted(set().union(*(r["sums"][st] for r in rollups)))
+        out[st] = {name: _avg(sum(r["sums"][st].get(name, 0) for r in rollups), n) for name in names}
+    curves = [chart_series(r["bins"], window, resolution) for r in rollups]
+    hourly, bands = {"labels": curves[0]["labels"]}, {}
+    for st in STATIONS:
+        columns = [sorted(values) for values in zip(*(c[st] for c in curves))]
+        hourly[st] = [round(sum(col) / n, 1) for col in columns]
+        bands[st] = {f"p{q}": [round(_percentile(col, q), 1) for col in columns] for q in BASELINE_BANDS}
+    out["hourly"], out["bands"] = hourly, bands
+    return out
+
+# ===== Продажи за период =====
+# /api/sales/range отвечает только из архива сводок, без обращения к Poster.
+# Дней, которых в архиве нет, в ответе нет — они перечислены в missing
+# и ставятся в очередь задачи backfill.
+RANGE_GRANULARITIES = ("day", "week", "hour")
+
+def _range_bucket(day, granularity):
+    if granularity == "week":
+        start = date.fromisoformat(day)
+        return (start - timedelta(days=start.weekday())).isoformat()   # понедельник
+    return day
+
+def sales_range(acc, first, last, granularity):
+    days, rows, cats = rollup_range(acc, first, last, granularity)
+    # Корзины есть у каждого сведённого дня, даже без продаж
+    buckets = {}
+    for day in days:
+        if granularity == "hour":
+            keys = [f"{day} {hour:02d}:00" for hour in range(24)]
+        else:
+            keys = [_range_bucket(day, granularity)]
+        for key in keys:
+            bucket = buckets.setdefault(key, dict({"start": key}, **{st: 0 for st in STATIONS}))
+            if granularity == "week":
+                bucket["days"] = bucket.get("days", 0) + 1
+    totals = {st: 0 for st in STATIONS}
+    for key, st, qty in rows:
+        bucket = buckets.get(_range_bucket(key, granularity))
+        if bucket is not None:
+            bucket[st] += qty
+            totals[st] += qty
+    categories = {st: {} for st in STATIONS}
+    for st, name, qty in cats:
+        categories[st][name] = qty
+
+    stored = set(days)
+    missing = []
+    day, end = date.fromisoformat(first), date.fromisoformat(last)
+    while day <= end:
+        if day.isoformat() not in stored:
+            missing.append(day.isoformat())
+        day += timedelta(days=1)
+    return {
+        "from": first, "to": last, "granularity": granularity,
+        "days": len(days), "missing": missing,
+        "buckets": list(buckets.values()), "totals": totals, "categories": categories,
+    }
 
 # ===== Погода =====
-def fetch_weather():
+def fetch_weather(acc):
     if not WEATHER_KEY:
         return {"temp": "Н/Д", "desc": "Н/Д", "icon": ""}
     try:
-        url = f"https://api.openweathermap.org/data/2.5/weather?lat=50.395&lon=30.355&appid={WEATHER_KEY}&units=metric&lang=uk"
-        resp = requests.get(url, timeout=10)
+        url = WEATHER_URL
+        params = {"lat": acc.lat, "lon": acc.lon, "appid": WEATHER_KEY, "units": "metric", "lang": "uk"}
+        resp = _get(url, params=params, endpoint="weather")
         data = resp.json()
         temp = round(data["main"]["temp"])
         desc = data["weather"][0]["description"].capitalize()
         icon = data["weather"][0]["icon"]
         return {"temp": f"{temp}°C", "desc": desc, "icon": icon}
     except Exception as e:
-        print("ERROR weather:", e, file=sys.stderr, flush=True)
-        return {"temp": "Н/Д", "desc": "Н/Д", "icon": ""}
+        print(f"ERROR weather [{acc.name}]:", e, file=sys.stderr, flush=True)
+        return None
 
 # ===== Столы =====
+# Раскладка по умолчанию; у заведения может быть своя (hall_tables, terrace_tables)
 HALL_TABLES = [1,2,3,4,5,6,8]
 TERRACE_TABLES = [7,10,11,12,13]
 
-def fetch_tables_with_waiters():
+def fetch_tables_with_waiters(acc):
     target_date = date.today().strftime("%Y%m%d")
     url = (
-        f"https://{ACCOUNT_NAME}.joinposter.com/api/dash.getTransactions"
-        f"?token={POSTER_TOKEN}&dateFrom={target_date}&dateTo={target_date}"
+        f"{acc.poster_api_url}/dash.getTransactions"
+        f"?token={acc.poster_token}&dateFrom={target_date}&dateTo={target_date}"
     )
     try:
         resp = _get(url)
-        rows = resp.json().get("response", [])
+        rows = poster_response(resp.json(), "dash.getTransactions")
     except Exception as e:
-        print("ERROR tables_with_waiters:", e, file=sys.stderr, flush=True)
-        rows = []
+        print(f"ERROR tables_with_waiters [{acc.name}]:", e, file=sys.stderr, flush=True)
+        return None
+    return tables_layout(acc, rows)
 
+def tables_layout(acc, rows):
     active = {}
     for trx in rows:
         try:
@@ -239,25 +1484,25 @@ def fetch_tables_with_waiters():
             })
         return out
 
-    return {"hall": build(HALL_TABLES), "terrace": build(TERRACE_TABLES)}
+    return {"hall": build(acc.hall_tables), "terrace": build(acc.terrace_tables)}
 
 # ===== Бронирования =====
-def fetch_bookings():
-    if not CHOICE_TOKEN:
+def fetch_bookings(acc):
+    if not acc.choice_token:
         return []
 
     try:
-        url = "https://api.choice.com/bookings/list"
-        headers = {"Authorization": f"Bearer {CHOICE_TOKEN}"}
+        url = CHOICE_URL
+        headers = {"Authorization": f"Bearer {acc.choice_token}"}
         params = {"perPage": 50, "page": 1}
-        resp = requests.get(url, headers=headers, params=params, timeout=15)
-        resp.raise_for_status()
+        resp = _get(url, params=params, headers=headers, endpoint="bookings")
         bookings = resp.json()
     except Exception as e:
-        print("ERROR bookings:", e, file=sys.stderr, flush=True)
-        return []
+        print(f"ERROR bookings [{acc.name}]:", e, file=sys.stderr, flush=True)
+        return None
+    return upcoming_bookings(bookings, datetime.now(timezone.utc))
 
-    now = datetime.now(timezone.utc)
+def upcoming_bookings(bookings, now):
     upcoming = []
     for b in bookings:
         try:
@@ -278,720 +1523,847 @@ def fetch_bookings():
     upcoming.sort(key=lambda x: x["time"])
     return upcoming
 
-# ===== API =====
-@app.route("/api/sales")
-def api_sales():
-    global CACHE, CACHE_TS
-    if time.time() - CACHE_TS > 60:
-        sums_today = fetch_category_sales(0)
-        sums_prev = fetch_category_sales(7)
-        hourly = fetch_transactions_hourly(0)
-        prev = fetch_transactions_hourly(7)
-
-        total_hot = sum(sums_today["hot"].values())
-        total_cold = sum(sums_today["cold"].values())
-        total_bar = sum(sums_today["bar"].values())
-        total_sum = total_hot + total_cold + total_bar
-        share = {
-            "hot": round(total_hot/total_sum*100) if total_sum else 0,
-            "cold": round(total_cold/total_sum*100) if total_sum else 0,
-            "bar": round(total_bar/total_sum*100) if total_sum else 0,
-        }
-
-        CACHE.update({
-            "hot": sums_today["hot"], "cold": sums_today["cold"],
-            "hot_prev": sums_prev["hot"], "cold_prev": sums_prev["cold"],
-            "hourly": hourly, "hourly_prev": prev,
-            "share": share, "weather": fetch_weather()
-        })
-        CACHE_TS = time.time()
-
-    return jsonify(CACHE)
-
-@app.route("/api/tables")
-def api_tables():
-    return jsonify(fetch_tables_with_waiters())
-
-@app.route("/api/bookings")
-def api_bookings():
-    return jsonify(fetch_bookings())
-# ===== UI =====
-@app.route("/")
-def index():
-    template = """
-    <!DOCTYPE html>
-    <html lang="uk">
-    <head>
-        <meta charset="utf-8" />
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Kitchen Dashboard</title>
-        <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-        <script src="https://cdn.jsdelivr.net/npm/chartjs-plugin-datalabels@2"></script>
-        <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700;800&display=swap" rel="stylesheet">
-        <style>
-            * {
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }
-
-            :root {
-                --bg-primary: #000000;
-                --bg-secondary: #1c1c1e;
-                --bg-tertiary: #2c2c2e;
-                --text-primary: #ffffff;
-                --text-secondary: #8e8e93;
-                --accent-hot: #ff9500;
-                --accent-cold: #007aff;
-                --accent-bar: #af52de;
-                --accent-success: #30d158;
-                --accent-warning: #ff9500;
-                --border-color: #38383a;
-                --shadow: 0 4px 20px rgba(0, 0, 0, 0.3);
-            }
-
-            body {
-                font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-                background: var(--bg-primary);
-                color: var(--text-primary);
-                overflow: hidden;
-                height: 100vh;
-                padding: 8px;
-            }
-
-            .dashboard {
-                display: grid;
-                grid-template-columns: 1fr 1fr 1fr 1fr;
-                grid-template-rows: minmax(0, 35vh) minmax(0, 58vh);
-                gap: 8px;
-                height: calc(100vh - 25px);
-                max-height: calc(100vh - 25px);
-                padding: 0;
-            }
-
-            .card {
-                background: var(--bg-secondary);
-                border-radius: 12px;
-                padding: 10px;
-                border: 1px solid var(--border-color);
-                box-shadow: var(--shadow);
-                overflow: hidden;
-                display: flex;
-                flex-direction: column;
-            }
-
-            .card h2 {
-                font-size: 14px;
-                font-weight: 600;
-                margin-bottom: 8px;
-                display: flex;
-                align-items: center;
-                gap: 6px;
-                color: var(--text-primary);
-            }
-
-            .card.hot h2 { color: var(--accent-hot); }
-            .card.cold h2 { color: var(--accent-cold); }
-            .card.share h2 { color: var(--accent-bar); }
-
-            /* Верхний ряд блоков */
-            .card.top-card {
-                min-height: 0;
-            }
-
-            /* Таблицы в карточках - оптимизированный шрифт */
-            table {
-                width: 100%;
-                border-collapse: collapse;
-                font-size: 13px;
-                margin-top: auto;
-            }
-
-            th, td {
-                padding: 5px 7px;
-                text-align: right;
-                border-bottom: 1px solid var(--border-color);
-            }
-
-            th:first-child, td:first-child {
-                text-align: left;
-            }
-
-            th {
-                color: var(--text-secondary);
-                font-weight: 600;
-                font-size: 11px;
-                text-transform: uppercase;
-                letter-spacing: 0.5px;
-            }
-
-            td {
-                color: var(--text-primary);
-                font-weight: 600;
-                font-size: 13px;
-            }
-
-            /* Блок с распределением заказов - компактный пирог */
-            .pie-container {
-                flex: 1;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                min-height: 0;
-                position: relative;
-                padding: 5px;
-            }
-
-            /* Блок времени и погоды - МАКСИМАЛЬНО УВЕЛИЧЕН */
-            .time-weather {
-                display: flex;
-                flex-direction: column;
-                align-items: center;
-                justify-content: center;
-                text-align: center;
-                flex: 1;
-                padding: 5px;
-                height: 100%;
-            }
-
-            .clock {
-                font-size: 68px;
-                font-weight: 900;
-                color: var(--text-primary);
-                font-variant-numeric: tabular-nums;
-                margin-bottom: 8px;
-                line-height: 0.85;
-            }
-
-            .weather {
-                display: flex;
-                flex-direction: column;
-                align-items: center;
-                gap: 4px;
-                flex: 1;
-            }
-
-            .weather img {
-                width: 100px;
-                height: 100px;
-                margin-bottom: 2px;
-            }
-
-            .temp {
-                font-size: 36px;
-                font-weight: 800;
-                color: var(--text-primary);
-                line-height: 1;
-            }
-
-            .desc {
-                font-size: 15px;
-                color: var(--text-secondary);
-                text-align: center;
-                font-weight: 600;
-            }
-
-            /* ГРАФИК: сужаем ширину (было 1 / 3), делаем 1 / 2 */
-            .chart-card {
-                grid-column: 1 / 2;
-                display: flex;
-                flex-direction: column;
-            }
-
-            .chart-container {
-                flex: 1;
-                min-height: 0;
-                position: relative;
-            }
-
-            /* НОВЫЙ БЛОК БРОНИРОВАНИЙ — встанет между графиком и столами */
-            .bookings-card {
-                grid-column: 2 / 3;
-                display: flex;
-                flex-direction: column;
-            }
-
-            /* Столы остаются как есть — 3 / 5 */
-            .tables-card {
-                grid-column: 3 / 5;
-                display: flex;
-                flex-direction: column;
-            }
-
-            .tables-content {
-                flex: 1;
-                display: flex;
-                flex-direction: column;
-                gap: 8px;
-                min-height: 0;
-            }
-
-            .tables-zone {
-                flex: 1;
-                min-height: 0;
-            }
-
-            .tables-zone h3 {
-                font-size: 12px;
-                font-weight: 600;
-                margin-bottom: 6px;
-                color: var(--text-secondary);
-                display: flex;
-                align-items: center;
-                gap: 4px;
-            }
-
-            .tables-grid {
-                display: grid;
-                grid-template-columns: repeat(auto-fit, minmax(130px, 1fr));
-                gap: 8px;
-                height: calc(100% - 20px);
-                align-content: start;
-            }
-
-            .table-tile {
-                border-radius: 12px;
-                padding: 15px 10px;
-                font-weight: 700;
-                text-align: center;
-                font-size: 16px;
-                display: flex;
-                flex-direction: column;
-                justify-content: center;
-                gap: 6px;
-                transition: all 0.2s ease;
-                border: 1px solid var(--border-color);
-                height: 105px;
-                width: 130px;
-                justify-self: center;
-            }
-
-            .table-tile.occupied {
-                background: linear-gradient(135deg, var(--accent-cold), #005ecb);
-                color: white;
-                border-color: var(--accent-cold);
-                box-shadow: 0 2px 8px rgba(0, 122, 255, 0.3);
-            }
-
-            .table-tile.free {
-                background: var(--bg-tertiary);
-                color: var(--text-secondary);
-                border-color: var(--border-color);
-            }
-
-            .table-number {
-                font-weight: 800;
-                font-size: 18px;
-                margin-bottom: 4px;
-            }
-
-            .table-waiter {
-                font-size: 14px;
-                font-weight: 700;
-                opacity: 0.95;
-                overflow: hidden;
-                text-overflow: ellipsis;
-                white-space: nowrap;
-                max-width: 100%;
-                line-height: 1.2;
-            }
-
-            /* Logo - компактный */
-            .logo {
-                position: fixed;
-                right: 15px;
-                bottom: 5px;
-                font-family: 'Inter', sans-serif;
-                font-weight: 800;
-                font-size: 14px;
-                color: #ffffff;
-                z-index: 1000;
-                background: var(--bg-secondary);
-                padding: 4px 8px;
-                border-radius: 6px;
-                border: 1px solid var(--border-color);
-            }
+# ===== Общий кэш между процессами =====
+# При нескольких воркерах (gunicorn -w N) внешние API опрашивает только
+# ведущий процесс: он держит аренду "leader" в общем хранилище и продлевает
+# её, пока жив. Остальные процессы не ходят в Poster, а каждую
+# секунду забирают из хранилища готовый снимок продаж; столы и
+# бронирования склеиваются single_flight уже между процессами под общей
+# блокировкой. Если ведущий пропал, аренду через LEADER_LEASE_SEC забирает
+# другой процесс и сразу запускает фоновые задачи.
+#
+# CACHE_BACKEND=memory (по умолчанию) — всё в памяти одного процесса, он же
+# всегда ведущий. CACHE_BACKEND=sqlite — общий файл SHARED_CACHE_PATH.
+class MemoryCache:
+    def __init__(self):
+        self._values = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def get(self, key, since=0):
+        # (значение, ts), если запись новее since, иначе None
+        found = self._values.get(key)
+        return found if found and found[1] > since else None
+
+    def put(self, key, value, ts=None):
+        self._values[key] = (value, ts or time.time())
+
+    @contextmanager
+    def lock(self, name):
+        with self._guard:
+            lk = self._locks.setdefault(name, threading.Lock())
+        with lk:
+            yield
+
+    def acquire_lease(self, name, owner, ttl):
+        return True
+
+    def release_lease(self, name, owner):
+        pass
+
+class SQLiteCache:
+    LOCK_TTL = 60        # блокировка упавшего процесса освобождается сама
+    LOCK_POLL = 0.05
+
+    def __init__(self, path):
+        self.path = path
+        self._conn, self._pid = None, None
+        self._guard = threading.Lock()
+
+    def _db(self):
+        # Соединение открывается в каждом процессе заново (после fork)
+        if self._conn is None or self._pid != os.getpid():
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS shared_cache ("
+                         " key TEXT PRIMARY KEY, value TEXT NOT NULL, ts REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases ("
+                         " name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, key, since=0):
+        with self._guard:
+            row = self._db().execute(
+                "SELECT value, ts FROM shared_cache WHERE key = ? AND ts > ?", (key, since)
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def put(self, key, value, ts=None):
+        data = json.dumps(value, ensure_ascii=False)
+        with self._guard:
+            self._db().execute(
+                "INSERT OR REPLACE INTO shared_cache (key, value, ts) VALUES (?, ?, ?)",
+                (key, data, ts or time.time()),
+            )
 
-            /* Canvas styling */
-            canvas {
-                max-width: 100% !important;
-                max-height: 100% !important;
-            }
+    def acquire_lease(self, name, owner, ttl):
+        # Аренда наша, если её не было, она уже наша или истекла
+        now = time.time()
+        with self._guard:
+            cur = self._db().execute(
+                "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires"
+                " WHERE leases.owner = excluded.owner OR leases.expires < ?",
+                (name, owner, now + ttl, now),
+            )
+            return cur.rowcount == 1
 
-            /* Responsive adjustments для очень маленьких экранов */
-            @media (max-height: 800px) {
-                body {
-                    padding: 6px;
-                }
-                
-                .dashboard {
-                    gap: 6px;
-                    grid-template-rows: minmax(0, 33vh) minmax(0, 60vh);
-                }
-                
-                .card {
-                    padding: 8px;
-                }
-                
-                .card h2 {
-                    font-size: 12px;
-                    margin-bottom: 6px;
-                }
-                
-                .clock {
-                    font-size: 56px;
-                }
-                
-                .weather img {
-                    width: 85px;
-                    height: 85px;
-                }
-                
-                .temp {
-                    font-size: 30px;
-                }
-                
-                table {
-                    font-size: 12px;
-                }
-                
-                th {
-                    font-size: 10px;
-                }
-                
-                td {
-                    font-size: 12px;
-                }
-                
-                .table-tile {
-                    height: 90px;
-                    width: 115px;
-                    padding: 12px 8px;
-                }
-                
-                .table-number {
-                    font-size: 16px;
-                }
-                
-                .table-waiter {
-                    font-size: 13px;
-                }
-            }
+    def release_lease(self, name, owner):
+        with self._guard:
+            self._db().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
 
-            @media (max-width: 1200px) {
-                .tables-grid {
-                    grid-template-columns: repeat(auto-fit, minmax(115px, 1fr));
-                }
-                
-                .table-tile {
-                    width: 115px;
-                    height: 95px;
-                    font-size: 15px;
-                }
-                
-                .table-number {
-                    font-size: 17px;
-                }
-                
-                .table-waiter {
-                    font-size: 13px;
-                }
-            }
-        </style>
-    </head>
-    <body>
-        <div class="dashboard">
-            <!-- Верхний ряд -->
-            <div class="card hot top-card">
-                <h2>🔥 Гарячий цех</h2>
-                <div style="flex: 1; overflow: hidden;">
-                    <table id="hot_tbl"></table>
-                </div>
-            </div>
-
-            <div class="card cold top-card">
-                <h2>❄️ Холодний цех</h2>
-                <div style="flex: 1; overflow: hidden;">
-                    <table id="cold_tbl"></table>
-                </div>
-            </div>
-
-            <div class="card share top-card">
-                <h2>📊 Розподіл замовлень</h2>
-                <div class="pie-container">
-                    <canvas id="pie" width="180" height="180"></canvas>
-                </div>
-            </div>
-
-            <div class="card top-card">
-                <h2>🕐 Час і погода</h2>
-                <div class="time-weather">
-                    <div id="clock" class="clock"></div>
-                    <div class="weather">
-                        <div id="weather-icon"></div>
-                        <div id="weather-temp" class="temp"></div>
-                        <div id="weather-desc" class="desc"></div>
-                    </div>
-                </div>
-            </div>
-
-            <!-- Нижний ряд -->
-            <!-- СУЖЕННЫЙ график: колонка 1 -->
-            <div class="card chart-card">
-                <h2>📈 Замовлення по годинам (накопич.)</h2>
-                <div class="chart-container">
-                    <canvas id="chart"></canvas>
-                </div>
-            </div>
-
-            <!-- НОВЫЙ блок БРОНИРОВАНЬ: колонка 2 -->
-            <div class="card bookings-card">
-                <h2>📅 Бронювання</h2>
-                <div style="flex:1; overflow:auto;">
-                    <table id="bookings_tbl"></table>
-                </div>
-            </div>
-
-            <!-- Столы — без изменений: колонки 3-4 -->
-            <div class="card tables-card">
-                <h2>🍽️ Столи</h2>
-                <div class="tables-content">
-                    <div class="tables-zone">
-                        <h3>🏛️ Зал</h3>
-                        <div id="hall" class="tables-grid"></div>
-                    </div>
-                    <div class="tables-zone">
-                        <h3>🌿 Літня тераса</h3>
-                        <div id="terrace" class="tables-grid"></div>
-                    </div>
-                </div>
-            </div>
-        </div>
-
-        <div class="logo">GRECO Tech ™</div>
-
-        <script>
-        let chart, pie;
-
-        function cutToNow(labels, arr){
-            const now = new Date();
-            const curHour = now.getHours();
-            let cutIndex = labels.findIndex(l => parseInt(l) > curHour);
-            if(cutIndex === -1) cutIndex = labels.length;
-            return arr.slice(0, cutIndex);
+    @contextmanager
+    def lock(self, name):
+        owner = f"{_process_id()}:{threading.get_ident()}"
+        while not self.acquire_lease(f"lock:{name}", owner, self.LOCK_TTL):
+            time.sleep(self.LOCK_POLL)
+        try:
+            yield
+        finally:
+            self.release_lease(f"lock:{name}", owner)
+
+def _process_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _make_cache_store():
+    if CACHE_BACKEND == "sqlite":
+        return SQLiteCache(SHARED_CACHE_PATH)
+    if CACHE_BACKEND != "memory":
+        raise ValueError(f"CACHE_BACKEND: unknown backend {CACHE_BACKEND!r}")
+    return MemoryCache()
+
+CACHE_STORE = _make_cache_store()
+LEADER = {"active": False, "checked": 0}
+
+def elect_leader():
+    now = time.time()
+    if now - LEADER["checked"] < LEADER_LEASE_SEC / 3:
+        return LEADER["active"]
+    LEADER["checked"] = now
+    try:
+        active = CACHE_STORE.acquire_lease("leader", _process_id(), LEADER_LEASE_SEC)
+    except sqlite3.Error as e:
+        print("ERROR leader lease:", e, file=sys.stderr, flush=True)
+        active = False
+    if active != LEADER["active"]:
+        print(f"DEBUG {_process_id()} is {'now' if active else 'no longer'} the leader",
+              file=sys.stderr, flush=True)
+    LEADER["active"] = active
+    set_gauge("dashboard_leader", int(active))
+    return active
+
+# ===== Заведения =====
+# Один процесс обслуживает все заведения сети. У каждого свой токен Poster,
+# категории цехов, раскладка столов, справочник товаров, снимки, поток
+# обновлений и фоновые задачи. Пулы FETCH_POOL/PAGE_POOL, HTTP-сессии
+# и архив закрытых дней общие, так что новое заведение добавляет только
+# свои данные, а не ещё один процесс со своими пулами и соединениями.
+ACCOUNT_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+RESERVED_NAMES = {"api", "metrics", "assets"}   # заняты маршрутами
+
+class Account:
+    def __init__(self, name, poster_token, choice_token=None, poster_api_url=None,
+                 hot_categories=None, cold_categories=None, bar_categories=None,
+                 hall_tables=None, terrace_tables=None, lat=50.395, lon=30.355, opening_hours=None):
+        self.name = name
+        self.poster_token = poster_token
+        self.choice_token = choice_token
+        self.poster_api_url = (poster_api_url or POSTER_API_URL).format(account=name)
+        self.hot_categories = set(HOT_CATEGORIES if hot_categories is None else hot_categories)
+        self.cold_categories = set(COLD_CATEGORIES if cold_categories is None else cold_categories)
+        self.bar_categories = set(BAR_CATEGORIES if bar_categories is None else bar_categories)
+        self.hall_tables = list(HALL_TABLES if hall_tables is None else hall_tables)
+        self.terrace_tables = list(TERRACE_TABLES if terrace_tables is None else terrace_tables)
+        self.lat, self.lon = lat, lon
+        self.opening_hours = (DEFAULT_OPENING_HOURS if opening_hours is None
+                              else parse_opening_hours(opening_hours, DEFAULT_OPENING_HOURS))
+        self.snapshot_path = CATALOG_SNAPSHOT_PATH.format(account=name)
+
+        # Справочник товаров и индекс product_id -> цех
+        self.products, self.product_station = {}, {}
+        self.products_ts = 0
+        self.products_complete = False
+        self.product_lock = threading.Lock()
+        # Готовый ответ /api/sales и его части от разных задач
+        self.cache = {
+            "hot": {}, "cold": {}, "hot_prev": {}, "cold_prev": {},
+            "hourly": {}, "hourly_prev": {}, "share": {}
         }
-
-        function renderTables(zoneId, data){
-            const el = document.getElementById(zoneId);
-            el.innerHTML = "";
-            data.forEach(t=>{
-                const div = document.createElement("div");
-                div.className = "table-tile " + (t.occupied ? "occupied":"free");
-                div.innerHTML = `
-                    <div class="table-number">${t.name}</div>
-                    <div class="table-waiter">${t.waiter}</div>
-                `;
-                el.appendChild(div);
-            });
+        self.cache_ts = 0
+        self.views = {}         # resolution -> (acc.cache, ответ с другой шириной слота)
+        # Части снимка; hourly и hourly_prev — гистограммы дня, baseline — сводки
+        # тех же дней недели за прошлые недели. updated — время последнего
+        # удачного обновления части, stale — части, чьё последнее обновление
+        # не удалось (значение — updated)
+        self.snapshot = {"sums": None, "hourly": None, "sums_prev": None, "hourly_prev": None,
+                         "baseline": None, "weather": None, "updated": {}, "stale": {}}
+        self.snapshot_lock = threading.Lock()
+        self.synced_ts = 0      # время снимка, прочитанного из CACHE_STORE
+        self.first_refresh = threading.Event()
+        # Чеки за сегодня, микрокэш, поток обновлений, фоновые задачи
+        self.ingest, self.ingest_lock = _empty_ingest(), threading.Lock()
+        self.flights = {}
+        self.stream = {"version": 0, "channels": {}, "clients": 0}
+        self.stream_cond = threading.Condition()
+        self.jobs, self.timings = {}, {}
+
+def _load_accounts():
+    try:
+        with open(ACCOUNTS_CONFIG) as f:
+            cfg = json.load(f)
+    except FileNotFoundError:
+        cfg = {}
+    accounts = {}
+    entries = cfg.get("accounts") or [{"name": ACCOUNT_NAME}]
+    # Общие токены — только для единственного заведения: иначе заведение
+    # без своего токена молча показывало бы данные другого
+    shared = len(entries) == 1
+    for entry in entries:
+        name = entry.get("name", "")
+        if not ACCOUNT_NAME_RE.match(name) or name in RESERVED_NAMES or name in accounts:
+            raise ValueError(f"{ACCOUNTS_CONFIG}: bad or duplicate account name {name!r}")
+        if not shared and not entry.get("poster_token"):
+            raise ValueError(f"{ACCOUNTS_CONFIG}: account {name!r} has no poster_token"
+                             " (required when several accounts are configured)")
+        accounts[name] = Account(
+            name,
+            poster_token=entry.get("poster_token") or (POSTER_TOKEN or cfg.get("POSTER_TOKEN") if shared else None),
+            choice_token=entry.get("choice_token") or (CHOICE_TOKEN or cfg.get("CHOICE_TOKEN") if shared else None),
+            poster_api_url=entry.get("poster_api_url"),
+            hot_categories=entry.get("hot_categories"),
+            cold_categories=entry.get("cold_categories"),
+            bar_categories=entry.get("bar_categories"),
+            hall_tables=entry.get("hall_tables"),
+            terrace_tables=entry.get("terrace_tables"),
+            lat=entry.get("lat", 50.395), lon=entry.get("lon", 30.355),
+            opening_hours=entry.get("opening_hours"),
+        )
+    return accounts
+
+ACCOUNTS = _load_accounts()
+# Маршруты без имени заведения (/api/sales, /) относятся к первому из списка
+DEFAULT_ACCOUNT = next(iter(ACCOUNTS.values()))
+
+def get_account(name):
+    if name is None:
+        return DEFAULT_ACCOUNT
+    acc = ACCOUNTS.get(name)
+    if acc is None:
+        abort(404)
+    return acc
+
+# ===== Поток обновлений (SSE) =====
+# Каналы sales/tables/bookings хранят последний снимок в виде готового JSON.
+# Экранам уходит событие только когда снимок действительно изменился.
+# У каждого заведения свой поток (acc.stream) и свои подписчики.
+def publish(acc, channel, payload):
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    stream = acc.stream
+    with acc.stream_cond:
+        current = stream["channels"].get(channel)
+        if current and current[1] == data:
+            return
+        stream["version"] += 1
+        stream["channels"][channel] = (stream["version"], data)
+        acc.stream_cond.notify_all()
+
+def _stream_events(acc, resolution=CHART_RESOLUTION):
+    # resolution — ширина слота графика для канала sales; снимок в канале
+    # собран с CHART_RESOLUTION, другие ширины пересчитываются из гистограмм
+    stream, cond = acc.stream, acc.stream_cond
+    seen = {}
+
+    def pending():
+        return [(ch, ver, data) for ch, (ver, data) in stream["channels"].items()
+                if ver > seen.get(ch, 0)]
+
+    with cond:
+        stream["clients"] += 1
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            with cond:
+                cond.wait_for(pending, timeout=STREAM_HEARTBEAT_SEC)
+                updates = pending()
+            if not updates:
+                yield ": ping\n\n"
+                continue
+            for ch, ver, data in updates:
+                seen[ch] = ver
+                if ch == "sales" and resolution != CHART_RESOLUTION:
+                    data = json.dumps(sales_view(acc, resolution), ensure_ascii=False, sort_keys=True)
+                yield f"event: {ch}\nid: {ver}\ndata: {data}\n\n"
+    finally:
+        with cond:
+            stream["clients"] -= 1
+
+# ===== Фоновое обновление =====
+# Каждый источник каждого заведения обновляется по своему расписанию
+# в отдельном потоке, обработчики HTTP только читают готовый снимок acc.cache.
+_scheduler_started = False
+_scheduler_lock = threading.Lock()
+
+def _sales_share(sums):
+    total_hot = sum(sums["hot"].values())
+    total_cold = sum(sums["cold"].values())
+    total_bar = sum(sums["bar"].values())
+    total_sum = total_hot + total_cold + total_bar
+    return {
+        "hot": round(total_hot/total_sum*100) if total_sum else 0,
+        "cold": round(total_cold/total_sum*100) if total_sum else 0,
+        "bar": round(total_bar/total_sum*100) if total_sum else 0,
+    }
+
+def _rebuild_cache(acc):
+    # Собираем новый словарь и подменяем ссылку целиком,
+    # чтобы ответ API никогда не видел наполовину обновлённые данные.
+    # stale: {часть: время последних удачных данных, 0 — их не было} —
+    # экран показывает по ним «дані на HH:MM» вместо нулей
+    empty_sums = {"hot": {}, "cold": {}, "bar": {}}
+    with acc.snapshot_lock:
+        snap = acc.snapshot
+        sums, sums_prev = snap.get("sums") or empty_sums, snap.get("sums_prev") or empty_sums
+        stale = dict(snap.get("stale") or {})
+        stale.update((key, entry["good"]) for key, entry in list(acc.flights.items()) if entry["stale"])
+        acc.cache = {
+            "hot": sums["hot"], "cold": sums["cold"],
+            "hot_prev": sums_prev["hot"], "cold_prev": sums_prev["cold"],
+            "share": _sales_share(sums),
+            "weather": snap.get("weather") or {"temp": "Н/Д", "desc": "Н/Д", "icon": ""},
+            "stale": stale,
+            **_sales_curves(acc, snap, CHART_RESOLUTION),
         }
+        acc.cache_ts = time.time()
+    publish(acc, "sales", acc.cache)
+
+def _sales_curves(acc, snap, resolution):
+    # Части /api/sales, зависящие от ширины слота: считаются из гистограмм
+    window = opening_window(acc, date.today())
+    today, prev, history = snap.get("hourly"), snap.get("hourly_prev"), snap.get("baseline")
+    return {
+        "resolution": resolution,
+        "hourly": chart_series(today, window, resolution) if today else {},
+        "hourly_prev": chart_series(prev, window, resolution) if prev else {},
+        "baseline": sales_baseline(history, window, resolution) if history else {"weeks": 0},
+    }
+
+def sales_view(acc, resolution):
+    # /api/sales с другой шириной слота: тот же снимок с пересчитанными
+    # кривыми. Готовый ответ живёт, пока не сменится acc.cache
+    cache = acc.cache
+    if resolution == cache.get("resolution", CHART_RESOLUTION):
+        return cache
+    found = acc.views.get(resolution)
+    if found and found[0] is cache:
+        return found[1]
+    with acc.snapshot_lock:
+        view = dict(cache, **_sales_curves(acc, acc.snapshot, resolution))
+    acc.views[resolution] = (cache, view)
+    return view
+
+def _set_parts(acc, parts):
+    # parts: {часть: значение}; None — обновление не удалось, остаётся
+    # прежнее значение, а часть помечается устаревшей
+    now = time.time()
+    with acc.snapshot_lock:
+        updated, stale = dict(acc.snapshot["updated"]), dict(acc.snapshot["stale"])
+        for name, value in parts.items():
+            if value is None:
+                stale.setdefault(name, updated.get(name, 0))
+            else:
+                acc.snapshot[name] = value
+                updated[name] = now
+                stale.pop(name, None)
+        acc.snapshot["updated"], acc.snapshot["stale"] = updated, stale
+        shared = dict(acc.snapshot)
+    try:
+        CACHE_STORE.put(f"{acc.name}/snapshot", shared)
+    except sqlite3.Error as e:
+        print(f"ERROR snapshot share [{acc.name}]:", e, file=sys.stderr, flush=True)
+    _rebuild_cache(acc)
 
-        // ==== БРОНИРОВАНИЯ ====
-        async function refreshBookings(){
-            try{
-                const r = await fetch('/api/bookings');
-                const bookings = await r.json();
-                const el = document.getElementById('bookings_tbl');
-                let html = "<tr><th>Ім'я</th><th>Час</th><th>Кількість гостей</th></tr>";
-                (bookings||[]).forEach(b=>{
-                    html += `<tr><td>${b.name||''}</td><td>${b.time||''}</td><td>${b.guests??''}</td></tr>`;
-                });
-                el.innerHTML = html;
-            }catch(e){
-                // тихо игнорируем
-            }
-        }
+def sync_shared_snapshot(acc):
+    # Процесс-последователь: берём снимок ведущего, если он обновился
+    try:
+        found = CACHE_STORE.get(f"{acc.name}/snapshot", since=acc.synced_ts)
+    except sqlite3.Error as e:
+        print(f"ERROR snapshot sync [{acc.name}]:", e, file=sys.stderr, flush=True)
+        return
+    if found is None:
+        return
+    shared, acc.synced_ts = found
+    with acc.snapshot_lock:
+        acc.snapshot.update(shared)
+    _rebuild_cache(acc)
+    if shared.get("sums") is not None or "sums" in (shared.get("stale") or {}):
+        acc.first_refresh.set()
+
+def refresh_products(acc):
+    load_products(acc, force=True)
+    return acc.products_complete
+
+def refresh_sales_today(acc):
+    timings = {}
+    res = fan_out({"sums": (fetch_category_sales, acc),
+                   "hourly": (fetch_transactions_hourly, acc)}, timings)
+    for name, seconds in timings.items():
+        note_timing(acc, "sales_today", name, seconds)
+    _set_parts(acc, res)
+    acc.first_refresh.set()
+    return None not in res.values()
+
+def refresh_sales_prev(acc):
+    # Тот же день недели неделю, две, ... BASELINE_WEEKS недель назад
+    days = [_target_date(7 * week) for week in range(1, max(1, BASELINE_WEEKS) + 1)]
+    rollups = closed_day_rollups(acc, days)
+    prev = rollups.get(days[0])
+    _set_parts(acc, {
+        "sums_prev": prev and prev["sums"],
+        "hourly_prev": prev and prev["bins"],
+        "baseline": [rollups[d] for d in days if d in rollups] or None,
+    })
+    # Недостающие дни догружаются при следующей попытке
+    return len(rollups) == len(days)
+
+def refresh_backfill(acc):
+    # Дни из очереди /api/sales/range — пачкой, самые свежие первыми
+    days = rollup_queued(acc, BACKFILL_BATCH_DAYS)
+    if not days:
+        return True
+    done = closed_day_rollups(acc, days)
+    rollup_dequeue(acc, list(done))
+    return len(done) == len(days)
+
+def refresh_weather(acc):
+    weather = fetch_weather(acc)
+    _set_parts(acc, {"weather": weather})
+    return weather is not None and weather.get("temp") != "Н/Д"
+
+# Столы и бронирования: последний удачный результат (None, если его ещё
+# не было), а current_* подставляют вместо None пустую раскладку и пустой список
+def tables_snapshot(acc):
+    return single_flight(acc, "tables", TABLES_TTL_SEC, lambda: fetch_tables_with_waiters(acc))
+
+def bookings_snapshot(acc):
+    return single_flight(acc, "bookings", BOOKINGS_TTL_SEC, lambda: fetch_bookings(acc))
+
+def current_tables(acc):
+    data = tables_snapshot(acc)
+    return tables_layout(acc, []) if data is None else data
+
+def current_bookings(acc):
+    data = bookings_snapshot(acc)
+    return [] if data is None else data
+
+def refresh_tables_stream(acc):
+    # Без подключённых экранов столы не опрашиваем вовсе
+    if acc.stream["clients"]:
+        publish(acc, "tables", current_tables(acc))
+    return True
+
+def refresh_bookings_stream(acc):
+    if acc.stream["clients"]:
+        publish(acc, "bookings", current_bookings(acc))
+    return True
+
+def add_job(acc, name, interval, func, key=None, first_run=0, role="leader"):
+    # func(acc) — обновление; key — необязательная функция без аргументов,
+    # смена её значения (например, даты) запускает задачу вне очереди.
+    # role: leader — только в ведущем процессе, any — во всех
+    acc.jobs[name] = {"interval": interval, "func": func, "key": key, "role": role,
+                      "next": first_run, "last_key": None, "running": False}
+
+def _run_job(acc, name, job, key):
+    started = time.time()
+    try:
+        ok = job["func"](acc)
+    except Exception as e:
+        print(f"ERROR job {name} [{acc.name}]:", e, file=sys.stderr, flush=True)
+        ok = False
+    job["last_key"] = key
+    job["next"] = started + (job["interval"] if ok else min(job["interval"], REFRESH_RETRY_SEC))
+    job["running"] = False
+    note_timing(acc, name, "total", time.time() - started, "ok" if ok else "failed")
+    observe("dashboard_job_seconds", time.time() - started, account=acc.name, job=name)
+    if ok:
+        set_gauge("dashboard_job_last_success_timestamp", round(time.time(), 3), account=acc.name, job=name)
+    else:
+        inc("dashboard_job_failures_total", account=acc.name, job=name)
+    print(f"DEBUG job {name} [{acc.name}] done in {time.time() - started:.2f}s ok={ok}",
+          file=sys.stderr, flush=True)
+
+def run_due_jobs():
+    # Каждая задача идёт в своём потоке: медленный источник не задерживает остальные
+    now = time.time()
+    leader = elect_leader()
+    for acc in ACCOUNTS.values():
+        if not leader:
+            sync_shared_snapshot(acc)
+        for name, job in list(acc.jobs.items()):
+            if job["running"] or (job["role"] == "leader" and not leader):
+                continue
+            key = job["key"]() if job["key"] else None
+            if now >= job["next"] or key != job["last_key"]:
+                job["running"] = True
+                t = threading.Thread(target=_run_job, args=(acc, name, job, key),
+                                     name=f"job-{acc.name}-{name}", daemon=True)
+                t.start()
+
+def _scheduler_loop():
+    while True:
+        run_due_jobs()
+        time.sleep(1)
+
+def start_scheduler():
+    global _scheduler_started
+    if _scheduler_started:
+        return
+    with _scheduler_lock:
+        if _scheduler_started:
+            return
+        threading.Thread(target=_scheduler_loop, name="scheduler", daemon=True).start()
+        _scheduler_started = True
+
+def _add_account_jobs(acc):
+    # Свежий снимок с диска не перегружаем сразу после старта
+    add_job(acc, "products", REFRESH_PRODUCTS_SEC, refresh_products,
+            first_run=acc.products_ts + REFRESH_PRODUCTS_SEC if load_catalog_snapshot(acc) else 0)
+    add_job(acc, "sales_today", REFRESH_SALES_SEC, refresh_sales_today)
+    add_job(acc, "sales_prev", REFRESH_PREV_SEC, refresh_sales_prev, key=date.today)
+    add_job(acc, "weather", REFRESH_WEATHER_SEC, refresh_weather)
+    add_job(acc, "backfill", BACKFILL_SEC, refresh_backfill)
+    # Первый подключившийся экран сразу запускает обновление столов и бронирований.
+    # Экраны подключены к разным процессам, поэтому эти задачи идут в каждом,
+    # а single_flight не даёт им дублировать запросы.
+    add_job(acc, "tables", STREAM_TABLES_SEC, refresh_tables_stream,
+            key=lambda: bool(acc.stream["clients"]), role="any")
+    add_job(acc, "bookings", STREAM_BOOKINGS_SEC, refresh_bookings_stream,
+            key=lambda: bool(acc.stream["clients"]), role="any")
+
+for _acc in ACCOUNTS.values():
+    _add_account_jobs(_acc)
+
+@app.before_request
+def _ensure_scheduler():
+    g.started = time.perf_counter()
+    start_scheduler()
+    _start_profile()
+
+@app.after_request
+def _observe_request(response):
+    elapsed = time.perf_counter() - g.get("started", time.perf_counter())
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    observe("dashboard_http_request_seconds", elapsed, route=route)
+    inc("dashboard_http_requests_total", route=route, status=response.status_code)
+    response.headers["Server-Timing"] = server_timing_header(elapsed)
+    _finish_profile(elapsed)
+    return response
+
+# ===== Ответы API =====
+# Тело ответа сериализуется и хэшируется один раз на снимок: снимки
+# (acc.cache, результат single_flight) заменяются целиком и после публикации
+# не меняются, поэтому их можно узнавать по id. Всё остальное (заглушки,
+# разовые ответы) кодируется с remember=False и в _ENCODED не попадает. ETag слабый — он одинаков для сжатого и несжатого тела.
+# Места хватает на несколько свежих снимков каждого заведения.
+_ENCODED = deque(maxlen=16 * len(ACCOUNTS))     # (payload, body, etag, {кодировка: байты})
+_encoded_lock = threading.Lock()
+
+def _encoded(payload, remember=True):
+    with _encoded_lock:
+        for entry in _ENCODED:
+            if entry[0] is payload:
+                return entry
+    body = app.json.dumps(payload).encode("utf-8")
+    entry = (payload, body, hashlib.sha1(body).hexdigest()[:20], {})
+    if remember:
+        with _encoded_lock:
+            _ENCODED.append(entry)
+    return entry
+
+def _compress(entry, encoding):
+    cached = entry[3].get(encoding)
+    if cached is None:
+        if encoding == "br":
+            cached = brotli.compress(entry[1], quality=5)
+        else:
+            cached = gzip.compress(entry[1], compresslevel=6)
+        entry[3][encoding] = cached
+    return cached
+
+def _accepted_encoding():
+    accept = request.accept_encodings
+    if brotli is not None and accept["br"]:
+        return "br"
+    if accept["gzip"]:
+        return "gzip"
+    return None
+
+def json_response(payload, max_age=0, remember=True):
+    # max_age — сколько секунд до следующего обновления данных на сервере;
+    # до этого момента браузер может брать ответ из своего кэша.
+    # remember=False — разовый ответ, не снимок: в _ENCODED его не кладём
+    with phase("serialize"):
+        entry = _encoded(payload, remember)
+    body, etag = entry[1], entry[2]
+    max_age = max(0, int(max_age))
+    headers = {
+        "ETag": f'W/"{etag}"',
+        "Cache-Control": f"private, max-age={max_age}" if max_age else "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+
+    encoding = _accepted_encoding() if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding:
+        with phase("compress"):
+            body = _compress(entry, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(body, mimetype="application/json", headers=headers)
+
+def json_error(status, message):
+    return Response(json.dumps({"error": message}), status=status, mimetype="application/json")
+
+def _resolution_arg():
+    # ?resolution=15 — ширина слота графика в минутах; None — недопустимое значение
+    raw = request.args.get("resolution")
+    if raw is None:
+        return CHART_RESOLUTION
+    try:
+        value = int(raw)
+    except ValueError:
+        return None
+    return value if value in RESOLUTIONS else None
 
-        async function refresh(){
-            const r = await fetch('/api/sales');
-            const data = await r.json();
-
-            function fill(id, today, prev){
-                const el = document.getElementById(id);
-                let html = "<tr><th>Категорі</th><th>Сьогодні</th><th>Мин. тиждень</th></tr>";
-                const keys = new Set([...Object.keys(today), ...Object.keys(prev)]);
-                keys.forEach(k => {
-                    html += `<tr><td>${k}</td><td>${today[k]||0}</td><td>${prev[k]||0}</td></tr>`;
-                });
-                el.innerHTML = html;
-            }
-            fill('hot_tbl', data.hot||{}, data.hot_prev||{});
-            fill('cold_tbl', data.cold||{}, data.cold_prev||{});
-
-            // Pie chart - компактный пирог с подписями внутри
-            Chart.register(ChartDataLabels);
-            const ctx2 = document.getElementById('pie').getContext('2d');
-            if(pie) pie.destroy();
-            pie = new Chart(ctx2,{
-                type:'pie',
-                data:{
-                    labels:['Гар.цех','Хол.цех','Бар'],
-                    datasets:[{
-                        data:[data.share.hot,data.share.cold,data.share.bar],
-                        backgroundColor:['#ff9500','#007aff','#af52de'],
-                        borderWidth: 2,
-                        borderColor: '#000'
-                    }]
-                },
-                options:{
-                    responsive: true,
-                    maintainAspectRatio: false,
-                    plugins:{
-                        legend:{display:false},
-                        tooltip:{enabled:false},
-                        datalabels:{
-                            color:'#fff',
-                            font:{weight:'bold', size:11, family:'Inter'},
-                            formatter:function(value, context){
-                                const label = context.chart.data.labels[context.dataIndex];
-                                return label + '\\n' + value + '%';
-                            },
-                            textAlign: 'center'
-                        }
-                    }
-                }
-            });
-
-            let today_hot = cutToNow(data.hourly.labels, data.hourly.hot);
-            let today_cold = cutToNow(data.hourly.labels, data.hourly.cold);
-
-            // Line chart
-            const ctx = document.getElementById('chart').getContext('2d');
-            if(chart) chart.destroy();
-            chart = new Chart(ctx,{
-                type:'line',
-                data:{
-                    labels:data.hourly.labels,
-                    datasets:[
-                        {
-                            label:'Гарячий',
-                            data:today_hot,
-                            borderColor:'#ff9500',
-                            backgroundColor:'rgba(255, 149, 0, 0.1)',
-                            tension:0.4,
-                            fill:false,
-                            borderWidth: 2,
-                            pointRadius: 3,
-                            pointBackgroundColor: '#ff9500'
-                        },
-                        {
-                            label:'Холодний',
-                            data:today_cold,
-                            borderColor:'#007aff',
-                            backgroundColor:'rgba(0, 122, 255, 0.1)',
-                            tension:0.4,
-                            fill:false,
-                            borderWidth: 2,
-                            pointRadius: 3,
-                            pointBackgroundColor: '#007aff'
-                        },
-                        {
-                            label:'Гарячий (мин. тиждн.)',
-                            data:data.hourly_prev.hot,
-                            borderColor:'rgba(255, 149, 0, 0.5)',
-                            borderDash:[6,4],
-                            tension:0.4,
-                            fill:false,
-                            borderWidth: 1,
-                            pointRadius: 2
-                        },
-                        {
-                            label:'Холодний (мин. тиждн.)',
-                            data:data.hourly_prev.cold,
-                            borderColor:'rgba(0, 122, 255, 0.5)',
-                            borderDash:[6,4],
-                            tension:0.4,
-                            fill:false,
-                            borderWidth: 1,
-                            pointRadius: 2
-                        }
-                    ]
-                },
-                options:{
-                    responsive:true,
-                    maintainAspectRatio: false,
-                    interaction: {
-                        intersect: false,
-                        mode: 'index'
-                    },
-                    plugins:{
-                        legend:{
-                            labels:{
-                                color:'#8e8e93',
-                                font: { size: 9 },
-                                usePointStyle: true,
-                                pointStyle: 'circle'
-                            }
-                        },
-                        datalabels:{display:false}
-                    },
-                    scales:{
-                        x:{
-                            ticks:{color:'#8e8e93', font: { size: 9 }},
-                            grid:{color:'rgba(142, 142, 147, 0.2)'},
-                            border:{color:'#38383a'}
-                        },
-                        y:{
-                            ticks:{color:'#8e8e93', font: { size: 9 }},
-                            grid:{color:'rgba(142, 142, 147, 0.2)'},
-                            border:{color:'#38383a'},
-                            beginAtZero:true
-                        }
-                    }
-                }
-            });
-
-            // Update time
-            const now = new Date();
-            document.getElementById('clock').innerText = now.toLocaleTimeString('uk-UA',{hour:'2-digit',minute:'2-digit'});
-            
-            // Update weather
-            const w = data.weather||{};
-            const iconEl = document.getElementById('weather-icon');
-            const tempEl = document.getElementById('weather-temp');
-            const descEl = document.getElementById('weather-desc');
-            
-            if(w.icon) {
-                iconEl.innerHTML = `<img src="https://openweathermap.org/img/wn/${w.icon}@2x.png" alt="weather">`;
-            } else {
-                iconEl.innerHTML = '';
-            }
-            
-            tempEl.textContent = w.temp || '—';
-            descEl.textContent = w.desc || '—';
-        }
+def _job_due_in(acc, name):
+    return acc.jobs[name]["next"] - time.time()
 
-        async function refreshTables(){
-            const r = await fetch('/api/tables');
-            const data = await r.json();
-            renderTables('hall', data.hall||[]);
-            renderTables('terrace', data.terrace||[]);
-        }
+def _flight_ttl_left(acc, key, ttl):
+    entry = acc.flights.get(key)
+    return ttl - (time.time() - entry["ts"]) if entry and entry["ts"] else 0
 
-        // Запуск сразу
-        refresh(); 
-        refreshTables();
-        refreshBookings();
-
-        // Автообновление
-        setInterval(refresh, 60000);
-        setInterval(refreshTables, 30000);
-        setInterval(refreshBookings, 60000);
-        </script>
-    </body>
-    </html>
-    """
-    return render_template_string(template)
+# ===== API =====
+# Каждый маршрут доступен как /<account>/api/..., а без имени заведения —
+# для заведения по умолчанию (первого в списке)
+@app.route("/api/sales", defaults={"account": None})
+@app.route("/<account>/api/sales")
+def api_sales(account):
+    acc = get_account(account)
+    resolution = _resolution_arg()
+    if resolution is None:
+        return json_error(400, f"resolution must be one of {', '.join(map(str, RESOLUTIONS))}")
+    # Сразу после старта ждём первый снимок, дальше отдаём готовые данные
+    inc("dashboard_cache_requests_total", account=acc.name, cache="sales",
+        result="hit" if acc.first_refresh.is_set() else "miss")
+    with phase("wait-first-refresh"):
+        acc.first_refresh.wait(timeout=60)
+    add_refresh_timings(acc, "sales_today", "transactions_today", "products", "weather")
+    if LEADER["active"]:
+        due = _job_due_in(acc, "sales_today")
+    else:
+        due = acc.synced_ts + REFRESH_SALES_SEC - time.time()
+    return json_response(sales_view(acc, resolution), max_age=due)
+
+@app.route("/api/sales/range", defaults={"account": None})
+@app.route("/<account>/api/sales/range")
+def api_sales_range(account):
+    acc = get_account(account)
+    granularity = request.args.get("granularity", "day")
+    if granularity not in RANGE_GRANULARITIES:
+        return json_error(400, f"granularity must be one of {', '.join(RANGE_GRANULARITIES)}")
+    try:
+        first = date.fromisoformat(request.args["from"])
+        last = date.fromisoformat(request.args.get("to") or request.args["from"])
+    except (KeyError, ValueError):
+        return json_error(400, "from and to must be YYYY-MM-DD dates")
+    # В архиве только закрытые дни: сегодняшний смотри в /api/sales
+    last = min(last, date.today() - timedelta(days=1))
+    if first > last:
+        return json_error(400, "empty range: only days before today are available")
+    if (last - first).days >= RANGE_MAX_DAYS:
+        return json_error(400, f"range is longer than {RANGE_MAX_DAYS} days")
+    with phase("query"):
+        try:
+            data = sales_range(acc, first.isoformat(), last.isoformat(), granularity)
+        except sqlite3.Error as e:
+            print("ERROR day_store read:", e, file=sys.stderr, flush=True)
+            return json_error(503, "day store is unavailable")
+    if data["missing"]:
+        rollup_enqueue(acc, data["missing"])
+    # Закрытые дни не меняются; пока часть дней догружается — до следующей пачки
+    max_age = _job_due_in(acc, "backfill") if data["missing"] else 3600
+    return json_response(data, max_age=max_age, remember=False)
+
+@app.route("/api/tables", defaults={"account": None})
+@app.route("/<account>/api/tables")
+def api_tables(account):
+    acc = get_account(account)
+    with phase("fetch"):
+        data = tables_snapshot(acc)
+    # Заглушка без данных новая на каждый запрос — в _ENCODED её не кладём
+    return json_response(tables_layout(acc, []) if data is None else data, remember=data is not None,
+                         max_age=_flight_ttl_left(acc, "tables", TABLES_TTL_SEC))
+
+@app.route("/api/bookings", defaults={"account": None})
+@app.route("/<account>/api/bookings")
+def api_bookings(account):
+    acc = get_account(account)
+    with phase("fetch"):
+        data = bookings_snapshot(acc)
+    return json_response([] if data is None else data, remember=data is not None,
+                         max_age=_flight_ttl_left(acc, "bookings", BOOKINGS_TTL_SEC))
+
+@app.route("/api/stream", defaults={"account": None})
+@app.route("/<account>/api/stream")
+def api_stream(account):
+    acc = get_account(account)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    resolution = _resolution_arg() or CHART_RESOLUTION
+    return Response(_stream_events(acc, resolution), mimetype="text/event-stream", headers=headers)
+
+@app.route("/metrics")
+def metrics():
+    now = time.time()
+    for acc in ACCOUNTS.values():
+        set_gauge("dashboard_cache_age_seconds", round(now - acc.cache_ts, 3) if acc.cache_ts else -1,
+                  account=acc.name, cache="sales")
+        set_gauge("dashboard_cache_age_seconds", round(now - acc.products_ts, 3) if acc.products_ts else -1,
+                  account=acc.name, cache="products")
+        set_gauge("dashboard_cache_entries", len(acc.products), account=acc.name, cache="products")
+        set_gauge("dashboard_stream_clients", acc.stream["clients"], account=acc.name)
+        for key, entry in list(acc.flights.items()):
+            set_gauge("dashboard_cache_age_seconds", round(now - entry["ts"], 3) if entry["ts"] else -1,
+                      account=acc.name, cache=key)
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/upstream")
+def api_upstream():
+    # Рядом со статистикой метода — состояние его предохранителей по хостам
+    stats = upstream_stats()
+    for source, state in breaker_states().items():
+        host, endpoint = source.split("/", 1)
+        stats.setdefault(endpoint, {}).setdefault("breakers", {})[host] = state
+    return json_response(stats, remember=False)
+
+# ===== Статические файлы =====
+# Стили, скрипты и шрифты лежат в static/ и отдаются по адресам с хэшем
+# содержимого (/assets/dashboard.3f9c1a2b7e.js) и Cache-Control: immutable,
+# так что перезагрузившийся киоск берёт их из своего кэша, не обращаясь
+# к сети. Файлы читаются, хэшируются и сжимаются один раз при старте.
+# Chart.js, плагин подписей и шрифт Inter кладёт в static/vendor скрипт
+# scripts/fetch_vendor.py (на Render — при сборке, см. test.yaml). Если их
+# там нет (свежая копия репозитория), страница берёт их с CDN, а в лог
+# пишется предупреждение.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+ASSET_TYPES = {".css": "text/css", ".js": "application/javascript", ".woff2": "font/woff2"}
+VENDOR_CDN = {
+    "vendor/chart.umd.min.js": "https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js",
+    "vendor/chartjs-plugin-datalabels.min.js":
+        "https://cdn.jsdelivr.net/npm/chartjs-plugin-datalabels@2.2.0/dist/chartjs-plugin-datalabels.min.js",
+    "vendor/inter.css": "https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700;800&display=swap",
+}
+ASSETS = {}       # имя с хэшем -> (тип, тело, {кодировка: байты})
+ASSET_URLS = {}   # имя в static/ -> адрес для страницы
+_CSS_URL_RE = re.compile(r"""url\((['"]?)([^'")]+)\1\)""")
+
+def _load_assets():
+    files = []
+    for folder, _, names in os.walk(STATIC_DIR):
+        for name in names:
+            if os.path.splitext(name)[1] in ASSET_TYPES:
+                files.append(os.path.relpath(os.path.join(folder, name), STATIC_DIR).replace(os.sep, "/"))
+    # Стили — последними: ссылки на шрифты в них заменяются адресами с хэшем
+    files.sort(key=lambda rel: (rel.endswith(".css"), rel))
+    for rel in files:
+        with open(os.path.join(STATIC_DIR, rel), "rb") as f:
+            body = f.read()
+        stem, ext = os.path.splitext(rel)
+        if ext == ".css":
+            def hashed_url(m, base=posixpath.dirname(rel)):
+                target = posixpath.normpath(posixpath.join(base, m.group(2)))
+                return f"url({ASSET_URLS[target]})" if target in ASSET_URLS else m.group(0)
+            body = _CSS_URL_RE.sub(hashed_url, body.decode("utf-8")).encode("utf-8")
+        hashed = f"{stem}.{hashlib.sha1(body).hexdigest()[:10]}{ext}"
+        encodings = {}
+        if ext != ".woff2":   # woff2 уже сжат
+            encodings["gzip"] = gzip.compress(body, compresslevel=9)
+            if brotli is not None:
+                encodings["br"] = brotli.compress(body)
+        ASSETS[hashed] = (ASSET_TYPES[ext], body, encodings)
+        ASSET_URLS[rel] = f"/assets/{hashed}"
+    missing = [rel for rel in VENDOR_CDN if rel not in ASSET_URLS]
+    for rel in missing:
+        ASSET_URLS[rel] = VENDOR_CDN[rel]
+    if missing:
+        print(f"WARNING static/{', static/'.join(missing)} not found, using CDN;"
+              " run python scripts/fetch_vendor.py", file=sys.stderr, flush=True)
+
+_load_assets()
+
+@app.route("/assets/<path:name>")
+def assets(name):
+    asset = ASSETS.get(name)
+    if asset is None:
+        abort(404)
+    mimetype, body, encodings = asset
+    headers = {"Cache-Control": "public, max-age=31536000, immutable", "Vary": "Accept-Encoding"}
+    encoding = _accepted_encoding()
+    if encoding in encodings:
+        body = encodings[encoding]
+        headers["Content-Encoding"] = encoding
+    return Response(body, mimetype=mimetype, headers=headers)
+
+# ===== UI =====
+# Шаблон компилируется один раз при импорте; на запрос остаётся только
+# подставить префикс заведения, адреса файлов и готовые снимки.
+# Страница никогда не ждёт внешние API: встраивается только то, что уже
+# есть в памяти, остальное придёт через /api/stream.
+INDEX_TEMPLATE = app.jinja_env.get_template("index.html")
+
+def category_rows(today, prev):
+    # Тот же порядок строк, что и в renderSales: сначала сегодняшние категории
+    names = list(today) + [name for name in prev if name not in today]
+    return [(name, today.get(name, 0), prev.get(name, 0)) for name in names]
+
+def cached_flight(acc, key):
+    # Последний результат single_flight, даже устаревший, без запроса наружу
+    entry = acc.flights.get(key)
+    if entry and entry["ts"]:
+        return entry["value"]
+    found = CACHE_STORE.get(f"{acc.name}/{key}")
+    return found[0] if found else None
+
+def initial_snapshots(acc, resolution):
+    return {
+        "sales": sales_view(acc, resolution) if acc.first_refresh.is_set() else None,
+        "tables": cached_flight(acc, "tables"),
+        "bookings": cached_flight(acc, "bookings"),
+    }
+
+@app.route("/", defaults={"account": None})
+@app.route("/<account>/")
+def index(account):
+    acc = get_account(account)
+    # /?resolution=15 — график с другой шириной слота (недопустимое значение игнорируется)
+    resolution = _resolution_arg() or CHART_RESOLUTION
+    with phase("render"):
+        html = INDEX_TEMPLATE.render(
+            base="" if account is None else f"/{acc.name}", assets=ASSET_URLS, resolution=resolution,
+            initial=initial_snapshots(acc, resolution) if PRERENDER else None, category_rows=category_rows,
+        ).encode("utf-8")
+    # Саму страницу проверяем при каждой загрузке: в ней адреса новых версий файлов
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if len(html) >= COMPRESS_MIN_BYTES and request.accept_encodings["gzip"]:
+        with phase("compress"):
+            html = gzip.compress(html, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return Response(html, mimetype="text/html", headers=headers)
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 5000))
+    start_scheduler()
     app.run(host="0.0.0.0", port=port)
@@ -0,0 +1,211 @@
+# Сквозной бенчмарк: app.py против локальной заглушки внешних API.
+#
+#   python bench/e2e.py --kiosks 10 --duration 30 --transactions 5000 --latency-ms 80
+#
+# Запускает fake_upstream.py и app.py отдельными процессами (чтобы клиенты,
+# сервер и заглушка не делили один GIL), замеряет холодные запросы сразу после
+# старта, затем N «экранов» крутят /api/sales, /api/tables и /api/bookings.
+# Итог: задержки p50/p95/max, пропускная способность и число вызовов
+# внешних API по методам — за холодный старт и за нагрузочную фазу.
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+ENDPOINTS = ("/api/sales", "/api/tables", "/api/bookings")
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"port {port} did not open in {timeout}s")
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+def _upstream_stats(port, reset=False):
+    r = requests.get(f"http://127.0.0.1:{port}/__stats", timeout=5).json()
+    if reset:
+        requests.get(f"http://127.0.0.1:{port}/__reset", timeout=5)
+    return r
+
+def start_upstream(args, port, log):
+    cmd = [
+        sys.executable, os.path.join(HERE, "fake_upstream.py"), "--port", str(port),
+        "--catalog", str(args.catalog), "--transactions", str(args.transactions),
+        "--growth", str(args.growth), "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms), "--error-rate", str(args.error_rate),
+        "--seed", str(args.seed),
+    ]
+    return subprocess.Popen(cmd, stdout=log, stderr=log, cwd=HERE)
+
+def start_app(args, port, upstream_port, data_dir, log):
+    base = f"http://127.0.0.1:{upstream_port}"
+    env = dict(os.environ, **{
+        "PORT": str(port),
+        "POSTER_TOKEN": "bench", "WEATHER_KEY": "bench", "CHOICE_TOKEN": "bench",
+        "POSTER_API_URL": f"{base}/api",
+        "WEATHER_URL": f"{base}/weather",
+        "CHOICE_URL": f"{base}/bookings/list",
+        "DAY_STORE_PATH": os.path.join(data_dir, "days.sqlite3"),
+        "CATALOG_SNAPSHOT_PATH": os.path.join(data_dir, "catalog-{account}.json"),
+        # Одно заведение по умолчанию, даже если рядом лежит config.json
+        "ACCOUNTS_CONFIG": os.path.join(data_dir, "accounts.json"),
+    })
+    env.update(dict(kv.split("=", 1) for kv in args.app_env))
+    return subprocess.Popen([sys.executable, os.path.join(ROOT, "app.py")],
+                            stdout=log, stderr=log, cwd=ROOT, env=env)
+
+def kiosk(base, deadline, think, results, lock):
+    sess = requests.Session()
+    sess.headers["Accept-Encoding"] = "gzip, br"
+    etags = {}
+    local = {ep: [] for ep in ENDPOINTS}
+    statuses = {}
+    while time.time() < deadline:
+        for ep in ENDPOINTS:
+            headers = {"If-None-Match": etags[ep]} if ep in etags else {}
+            started = time.perf_counter()
+            try:
+                r = sess.get(base + ep, headers=headers, timeout=60)
+                status = r.status_code
+                if r.headers.get("ETag"):
+                    etags[ep] = r.headers["ETag"]
+            except requests.RequestException:
+                status = "error"
+            local[ep].append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+            if think:
+                time.sleep(think)
+    with lock:
+        for ep, vals in local.items():
+            results["latency"][ep].extend(vals)
+        for status, n in statuses.items():
+            results["status"][str(status)] = results["status"].get(str(status), 0) + n
+
+def run(args):
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="dashboard-bench-")
+    os.makedirs(data_dir, exist_ok=True)
+    up_port, app_port = _free_port(), _free_port()
+    log = open(os.path.join(data_dir, "bench.log"), "ab")
+    procs = []
+    try:
+        procs.append(start_upstream(args, up_port, log))
+        _wait_port(up_port)
+        procs.append(start_app(args, app_port, up_port, data_dir, log))
+        _wait_port(app_port)
+        base = f"http://127.0.0.1:{app_port}"
+
+        # Холодный старт: первые запросы к каждому эндпоинту
+        cold = {}
+        for ep in ENDPOINTS:
+            started = time.perf_counter()
+            requests.get(base + ep, timeout=120)
+            cold[ep] = time.perf_counter() - started
+        time.sleep(args.settle)
+        cold_calls = _upstream_stats(up_port, reset=True)
+
+        # Нагрузка: N экранов одновременно
+        results = {"latency": {ep: [] for ep in ENDPOINTS}, "status": {}}
+        lock = threading.Lock()
+        deadline = time.time() + args.duration
+        threads = [
+            threading.Thread(target=kiosk, args=(base, deadline, args.think_ms / 1000, results, lock))
+            for _ in range(args.kiosks)
+        ]
+        started = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - started
+        warm_calls = _upstream_stats(up_port)
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=10)
+        log.close()
+
+    total = sum(len(v) for v in results["latency"].values())
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("json",)},
+        "cold_ms": {ep: round(v * 1000, 1) for ep, v in cold.items()},
+        "cold_upstream_calls": cold_calls["calls"],
+        "warm": {
+            ep: {
+                "requests": len(vals),
+                "p50_ms": round(_percentile(vals, 50) * 1000, 2),
+                "p95_ms": round(_percentile(vals, 95) * 1000, 2),
+                "max_ms": round(max(vals) * 1000, 2) if vals else 0,
+            }
+            for ep, vals in results["latency"].items()
+        },
+        "status": results["status"],
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0,
+        "warm_upstream_calls": warm_calls["calls"],
+        "warm_upstream_calls_per_min": round(sum(warm_calls["calls"].values()) / elapsed * 60, 1) if elapsed else 0,
+        "warm_upstream_errors": warm_calls["errors"],
+        "data_dir": data_dir,
+    }
+
+def print_report(rep):
+    print("cold start:")
+    for ep, ms in rep["cold_ms"].items():
+        print(f"  {ep:<16} {ms:>9.1f} ms")
+    print("  upstream calls:", ", ".join(f"{k}={v}" for k, v in sorted(rep["cold_upstream_calls"].items())))
+    print(f"warm ({rep['config']['kiosks']} kiosks, {rep['config']['duration']}s):")
+    print(f"  {'endpoint':<16} {'reqs':>7} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for ep, st in rep["warm"].items():
+        print(f"  {ep:<16} {st['requests']:>7} {st['p50_ms']:>9.2f} {st['p95_ms']:>9.2f} {st['max_ms']:>9.2f}")
+    print(f"  throughput: {rep['throughput_rps']} req/s, statuses: {rep['status']}")
+    print("  upstream calls:", ", ".join(f"{k}={v}" for k, v in sorted(rep["warm_upstream_calls"].items())),
+          f"({rep['warm_upstream_calls_per_min']}/min, {rep['warm_upstream_errors']} injected errors)")
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Сквозной бенчмарк дашборда с локальной заглушкой API")
+    ap.add_argument("--kiosks", type=int, default=10, help="одновременных экранов")
+    ap.add_argument("--duration", type=float, default=20, help="длительность нагрузки, сек")
+    ap.add_argument("--think-ms", type=float, default=0, help="пауза экрана между запросами")
+    ap.add_argument("--settle", type=float, default=2, help="пауза после холодного старта, сек")
+    ap.add_argument("--catalog", type=int, default=2000)
+    ap.add_argument("--transactions", type=int, default=3000)
+    ap.add_argument("--growth", type=float, default=1.0)
+    ap.add_argument("--latency-ms", type=float, default=50)
+    ap.add_argument("--jitter-ms", type=float, default=30)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--data-dir", help="каталог для SQLite и снимка справочника (по умолчанию временный)")
+    ap.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                    help="дополнительные переменные окружения для app.py")
+    ap.add_argument("--json", help="сохранить отчёт в JSON")
+    return ap.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,148 @@
+# Локальная заглушка Poster / OpenWeather / Choice для бенчмарков.
+#
+#   python bench/fake_upstream.py --port 8765 --transactions 5000 --latency-ms 80
+#
+# Poster:   /api/menu.getProducts, /api/dash.getCategoriesSales,
+#           /api/transactions.getTransactions, /api/dash.getTransactions
+# Погода:   /weather        Бронирования: /bookings/list
+# Служебное: /__stats — счётчики вызовов по методам, /__reset — обнулить их.
+#
+# Сегодняшний день «растёт»: сначала видна часть чеков, затем каждую
+# секунду закрывается ещё --growth чеков. Прошедшие дни отдаются целиком.
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import synthetic
+
+class Upstream:
+    def __init__(self, args):
+        self.args = args
+        self.catalog = synthetic.catalog(args.catalog, args.seed)
+        self.started = time.time()
+        self.calls = Counter()
+        self.bytes = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+        self._days = {}
+
+    def day(self, day):
+        with self.lock:
+            if day not in self._days:
+                trx = synthetic.day_transactions(day, self.args.transactions, self.args.catalog, self.args.seed)
+                self._days[day] = (trx, synthetic.category_sales(trx, self.catalog))
+            trx, sales = self._days[day]
+        if day != date.today().isoformat():
+            return trx, sales
+        # Сегодня: видна начальная доля чеков плюс прирост с момента старта
+        visible = int(len(trx) * self.args.initial_share + (time.time() - self.started) * self.args.growth)
+        visible = min(len(trx), visible)
+        return trx[:visible], sales
+
+    def handle(self, path, q):
+        method = path.rsplit("/", 1)[-1]
+        page = int(q.get("page", 1))
+        per_page = int(q.get("per_page", 500))
+        if method == "menu.getProducts":
+            items = [p for p in self.catalog if (q.get("type") == "batchtickets") == (int(p["product_id"]) % 20 == 0)]
+            return method, {"response": items[(page - 1) * per_page: page * per_page]}
+        if method == "dash.getCategoriesSales":
+            return method, {"response": self.day(q.get("dateFrom", date.today().isoformat()))[1]}
+        if method == "transactions.getTransactions":
+            trx = self.day(q.get("date_from", date.today().isoformat()))[0]
+            return method, {"response": {
+                "count": len(trx),
+                "page": {"per_page": per_page, "page": page},
+                "data": trx[(page - 1) * per_page: page * per_page],
+            }}
+        if method == "dash.getTransactions":
+            return method, {"response": synthetic.dash_transactions(self.args.open_checks, self.args.seed)}
+        if path == "/weather":
+            return "weather", synthetic.weather()
+        if path == "/bookings/list":
+            return "bookings", synthetic.bookings(self.args.bookings, self.args.seed)
+        return None, None
+
+def make_handler(up):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, payload, headers=()):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in headers:
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+            return len(body)
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            q = {k: v[0] for k, v in parse_qs(parts.query).items()}
+            if parts.path == "/__stats":
+                with up.lock:
+                    stats = {"calls": dict(up.calls), "bytes": up.bytes, "errors": up.errors}
+                self._send(200, stats)
+                return
+            if parts.path == "/__reset":
+                with up.lock:
+                    up.calls.clear()
+                    up.bytes = up.errors = 0
+                self._send(200, {"ok": True})
+                return
+
+            method, payload = up.handle(parts.path, q)
+            if method is None:
+                self._send(404, {"error": "unknown method"})
+                return
+            with up.lock:
+                up.calls[method] += 1
+            delay = (up.args.latency_ms + random.uniform(0, up.args.jitter_ms)) / 1000
+            time.sleep(delay)
+            if random.random() < up.args.error_rate:
+                with up.lock:
+                    up.errors += 1
+                self._send(503, {"error": "injected"}, [("Retry-After", "1")])
+                return
+            n = self._send(200, payload)
+            with up.lock:
+                up.bytes += n
+
+    return Handler
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Локальная заглушка внешних API для бенчмарков")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--catalog", type=int, default=2000, help="товаров в справочнике")
+    ap.add_argument("--transactions", type=int, default=3000, help="чеков за день")
+    ap.add_argument("--initial-share", type=float, default=0.7, help="доля сегодняшних чеков, видимая сразу")
+    ap.add_argument("--growth", type=float, default=1.0, help="новых чеков в секунду")
+    ap.add_argument("--open-checks", type=int, default=40, help="строк в dash.getTransactions")
+    ap.add_argument("--bookings", type=int, default=20)
+    ap.add_argument("--latency-ms", type=float, default=50)
+    ap.add_argument("--jitter-ms", type=float, default=30)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    return ap.parse_args(argv)
+
+def serve(args):
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(Upstream(args)))
+    server.daemon_threads = True
+    print(f"fake upstream on http://{args.host}:{args.port}", file=sys.stderr, flush=True)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    serve(parse_args())
@@ -0,0 +1,195 @@
+# Микробенчмарки чистых участков обработки данных, без сети:
+# классификация продаж по категориям, потоковый разбор страниц чеков,
+# раскладка строк в колонки, почасовые суммы с накоплением,
+# свёртка занятых столов и отбор/сортировка бронирований.
+#
+#   python bench/micro.py                     # замер и сравнение с базой
+#   python bench/micro.py --save-baseline     # записать текущие значения как базу
+#   python bench/micro.py --sizes 1000 10000 --threshold 0.25
+#
+# Перед замерами iter_json проверяется на образцах, разрезанных на куски
+# всех размеров (граница куска на каждом смещении); при расхождении скрипт
+# завершается с кодом 1, не начиная замеры.
+#
+# База хранится в bench/micro_baseline.json (у каждой машины своя).
+# Если какой-то замер медленнее базы больше чем на --threshold,
+# он помечается REGRESSION, а скрипт завершается с кодом 1.
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+# app.py при импорте подхватывает снимок справочника — уводим его во временный каталог
+_tmp = tempfile.mkdtemp(prefix="dashboard-micro-")
+os.environ.setdefault("CATALOG_SNAPSHOT_PATH", os.path.join(_tmp, "catalog-{account}.json"))
+os.environ.setdefault("DAY_STORE_PATH", os.path.join(_tmp, "days.sqlite3"))
+
+import app  # noqa: E402
+import synthetic  # noqa: E402
+
+BASELINE_PATH = os.path.join(HERE, "micro_baseline.json")
+CATALOG_SIZE = 3000
+
+class _Body:
+    # Минимальная замена requests.Response для iter_json
+    url = "http://bench/api/transactions.getTransactions"
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.chunk = None   # размер куска вместо запрошенного iter_json
+
+    def iter_content(self, chunk_size):
+        chunk_size = self.chunk or chunk_size
+        for i in range(0, len(self.raw), chunk_size):
+            yield self.raw[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+# Числа с точкой и экспонентой, строки с экранированием и не-ASCII,
+# вложенные объекты и соседние поля — всё, что может разрезать граница куска
+SPLIT_SAMPLES = [
+    '{"response":{"data":[1.5, 2]}}',
+    '{"response":{"data":[1e5,-2.5E-3,0,-7,12345678901234567890,1.0e+2,true,false,null]},"count":9}',
+    '{"count":3,"response":{"page":{"per_page":100},"data":['
+    '{"transaction_id":1,"date_close":"2024-05-01 10:00:00","sum":1.25e2,'
+    '"products":[{"product_id":"17","num":"2.0"}]},'
+    '{"name":"Оля \\"Кава\\" \\\\ 🍕","products":[],"nested":{"a":[1.0,[2.5e-1]]}},'
+    '[],{}]}}',
+    '{"response":{"data":[]},"error":{"code":10,"message":"Токен"}}',
+]
+
+def check_iter_json():
+    # -> список расхождений (образец, размер куска, что получилось)
+    failures = []
+    for sample in SPLIT_SAMPLES:
+        raw = sample.encode("utf-8")
+        parsed = json.loads(sample)
+        expected = parsed["response"]["data"]
+        for chunk in range(1, len(raw) + 1):
+            body = _Body(raw)
+            body.chunk = chunk
+            meta, got, error = {}, [], False
+            try:
+                for item in app.iter_json(body, ("response", "data"), meta):
+                    got.append(item)
+            except app.PosterError:
+                error = True
+            except ValueError as e:
+                got = e
+            # Тело с error должно разобраться целиком и закончиться PosterError
+            if got != expected or error != ("error" in parsed):
+                failures.append((raw[:40], chunk, got))
+    return failures
+
+def build_cases(size):
+    day = date.today().isoformat()
+    catalog = synthetic.catalog(CATALOG_SIZE)
+    acc = app.DEFAULT_ACCOUNT
+    with acc.product_lock:
+        app._apply_catalog(acc, {int(p["product_id"]): int(p["menu_category_id"]) for p in catalog})
+    stations = acc.product_station
+
+    trx = synthetic.day_transactions(day, size, CATALOG_SIZE)
+    per_page = app.POSTER_PER_PAGE
+    pages = [
+        json.dumps({"response": {"count": size, "page": {"per_page": per_page},
+                                 "data": trx[i:i + per_page]}}, ensure_ascii=False).encode("utf-8")
+        for i in range(0, size, per_page)
+    ]
+    batch = app.flatten_lines(trx, stations)
+    categories = [
+        {"category_id": str(synthetic.ALL_CATEGORIES[i % len(synthetic.ALL_CATEGORIES)]),
+         "category_name": f"Категорія {i % 97}", "count": f"{i % 13}.000"}
+        for i in range(size)
+    ]
+    dash = synthetic.dash_transactions(size)
+    bookings = synthetic.bookings(size)
+    now = datetime.now(timezone.utc)
+
+    def parse_pages():
+        for raw in pages:
+            for _ in app.iter_json(_Body(raw), ("response", "data"), {}):
+                pass
+
+    def parse_and_flatten():
+        for raw in pages:
+            app.flatten_lines(app.iter_json(_Body(raw), ("response", "data"), {}), stations)
+
+    return {
+        "categories.classify": lambda: app.classify_category_sales(acc, categories),
+        "transactions.parse": parse_pages,
+        "transactions.parse+flatten": parse_and_flatten,
+        "transactions.flatten": lambda: app.flatten_lines(trx, stations),
+        "transactions.bucket+cumsum": lambda: app.chart_series(app.bucket_lines(batch, app._empty_bins()),
+                                                               acc.opening_hours[0], app.CHART_RESOLUTION),
+        "tables.fold": lambda: app.tables_layout(acc, dash),
+        "bookings.filter+sort": lambda: app.upcoming_bookings(bookings, now),
+    }
+
+def measure(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Микробенчмарки агрегации на синтетических днях")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                    help="чеков (строк) в сгенерированном дне")
+    ap.add_argument("--repeat", type=int, default=5, help="повторов, берётся лучший")
+    ap.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление относительно базы")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--save-baseline", action="store_true")
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    failures = check_iter_json()
+    if failures:
+        for raw, chunk, got in failures[:10]:
+            print(f"iter_json mismatch: {raw!r}... chunk={chunk}: {got!r}")
+        print(f"{len(failures)} iter_json split check(s) failed")
+        return 1
+
+    results, regressions = {}, []
+    print(f"{'benchmark':<30} {'size':>7} {'ms':>10} {'base ms':>10} {'ratio':>7}")
+    for size in args.sizes:
+        for name, fn in build_cases(size).items():
+            key = f"{name}@{size}"
+            ms = measure(fn, args.repeat)
+            results[key] = round(ms, 3)
+            base = baseline.get(key)
+            ratio = ms / base if base else None
+            flag = ""
+            if ratio is not None and ratio > 1 + args.threshold:
+                flag = "  REGRESSION"
+                regressions.append(key)
+            print(f"{name:<30} {size:>7} {ms:>10.2f} {base if base else '—':>10} "
+                  f"{(f'{ratio:.2f}' if ratio else '—'):>7}{flag}")
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.baseline}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+# Синтетические данные в форматах Poster, OpenWeather и Choice.
+# Используются локальной заглушкой (fake_upstream.py) и микробенчмарками.
+# Данные детерминированы: одинаковые seed и дата дают одинаковый день.
+import random
+from datetime import datetime, timedelta, timezone
+
+# Те же ID категорий, что в app.py, плюс несколько «прочих»
+HOT_CATEGORIES = [4, 13, 15, 46, 33]
+COLD_CATEGORIES = [7, 8, 11, 16, 18, 19, 29, 32, 36, 44]
+BAR_CATEGORIES = [9, 14, 27, 28, 34, 41, 42, 47, 22, 24, 25, 26, 39, 30]
+OTHER_CATEGORIES = [50, 51, 52]
+ALL_CATEGORIES = HOT_CATEGORIES + COLD_CATEGORIES + BAR_CATEGORIES + OTHER_CATEGORIES
+
+WAITERS = ["Оля", "Іван", "Марія", "Петро", "Софія", "Андрій"]
+TABLES = [1, 2, 3, 4, 5, 6, 7, 8, 10, 11, 12, 13]
+
+# Вес часа в течение дня: обеденный и вечерний пики
+HOUR_WEIGHTS = {9: 1, 10: 3, 11: 5, 12: 9, 13: 10, 14: 7, 15: 4, 16: 4,
+                17: 6, 18: 9, 19: 10, 20: 8, 21: 5, 22: 3, 23: 1}
+
+def _rng(seed, *parts):
+    return random.Random(":".join(str(p) for p in (seed,) + parts))
+
+def catalog(size, seed=1):
+    rng = _rng(seed, "catalog")
+    return [
+        {
+            "product_id": str(pid),
+            "product_name": f"Товар {pid}",
+            "menu_category_id": str(rng.choice(ALL_CATEGORIES)),
+        }
+        for pid in range(1, size + 1)
+    ]
+
+def day_transactions(day, count, catalog_size, seed=1, max_lines=6):
+    # day — "YYYY-MM-DD"; чеки отсортированы по времени закрытия,
+    # transaction_id растёт вместе со временем, как в Poster
+    rng = _rng(seed, "day", day)
+    hours = list(HOUR_WEIGHTS)
+    weights = [HOUR_WEIGHTS[h] for h in hours]
+    stamps = sorted(
+        rng.choices(hours, weights)[0] * 3600 + rng.randrange(3600)
+        for _ in range(count)
+    )
+    base_id = int(day.replace("-", "")) % 100000 * 1000000
+    out = []
+    for i, sec in enumerate(stamps):
+        products = [
+            {"product_id": str(rng.randint(1, catalog_size)),
+             "num": rng.choice(["1", "1.000", "2", "2.000", "3"])}
+            for _ in range(rng.randint(1, max_lines))
+        ]
+        out.append({
+            "transaction_id": str(base_id + i + 1),
+            "date_close": f"{day} {sec // 3600:02d}:{sec // 60 % 60:02d}:{sec % 60:02d}",
+            "status": "2",
+            "table_id": str(rng.choice(TABLES)),
+            "products": products,
+        })
+    return out
+
+def category_sales(transactions, catalog_items):
+    cats = {int(p["product_id"]): int(p["menu_category_id"]) for p in catalog_items}
+    totals = {}
+    for trx in transactions:
+        for p in trx["products"]:
+            cid = cats.get(int(p["product_id"]))
+            if cid is not None:
+                totals[cid] = totals.get(cid, 0) + float(p["num"])
+    return [
+        {"category_id": str(cid), "category_name": f"Категорія {cid}", "count": f"{qty:.3f}"}
+        for cid, qty in sorted(totals.items())
+    ]
+
+def dash_transactions(count, seed=1, open_share=0.3):
+    # Формат dash.getTransactions: открытые чеки (status 1) занимают столы
+    rng = _rng(seed, "dash", count)
+    return [
+        {
+            "transaction_id": str(i + 1),
+            "status": "1" if rng.random() < open_share else "2",
+            "table_name": str(rng.choice(TABLES)),
+            "name": rng.choice(WAITERS),
+        }
+        for i in range(count)
+    ]
+
+def bookings(count, seed=1, now=None):
+    now = now or datetime.now(timezone.utc)
+    rng = _rng(seed, "bookings", count)
+    out = []
+    for i in range(count):
+        at = now + timedelta(minutes=rng.randint(-240, 600))
+        out.append({
+            "id": i + 1,
+            "dateTime": at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "customer": {"name": f"Гість {i + 1}"},
+            "personCount": rng.randint(1, 8),
+        })
+    return out
+
+def weather():
+    return {"main": {"temp": 17.4}, "weather": [{"description": "хмарно", "icon": "04d"}]}
@@ -0,0 +1,67 @@
+# Скачивает сторонние файлы страницы в static/vendor, чтобы киоск не зависел
+# от CDN: Chart.js, плагин подписей chartjs-plugin-datalabels и шрифт Inter
+# (латиница и кириллица, начертания 400–800) с готовым inter.css.
+#
+#   python scripts/fetch_vendor.py
+#
+# Версии закреплены ниже. На Render скрипт запускается при сборке
+# (buildCommand в test.yaml); локально — вручную перед первым запуском.
+# app.py подхватит файлы при старте и будет отдавать их с хэшем в имени,
+# а без них — подключать их с CDN.
+import os
+import sys
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VENDOR_DIR = os.path.join(ROOT, "static", "vendor")
+
+CDN = "https://cdn.jsdelivr.net/npm"
+CHART_JS = f"{CDN}/chart.js@4.4.1/dist/chart.umd.min.js"
+DATALABELS = f"{CDN}/chartjs-plugin-datalabels@2.2.0/dist/chartjs-plugin-datalabels.min.js"
+INTER = f"{CDN}/@fontsource/inter@5.0.16/files"
+WEIGHTS = (400, 500, 600, 700, 800)
+SUBSETS = {
+    "latin": "U+0000-00FF, U+0131, U+0152-0153, U+02BB-02BC, U+02C6, U+02DA, U+02DC, U+0304, "
+             "U+0308, U+0329, U+2000-206F, U+2074, U+20AC, U+2122, U+2191, U+2193, U+2212, "
+             "U+2215, U+FEFF, U+FFFD",
+    "cyrillic": "U+0301, U+0400-045F, U+0490-0491, U+04B0-04B1, U+2116",
+}
+
+def download(url, name):
+    resp = requests.get(url, timeout=30)
+    resp.raise_for_status()
+    with open(os.path.join(VENDOR_DIR, name), "wb") as f:
+        f.write(resp.content)
+    print(f"{name}: {len(resp.content)} bytes")
+
+def main():
+    os.makedirs(VENDOR_DIR, exist_ok=True)
+    download(CHART_JS, "chart.umd.min.js")
+    download(DATALABELS, "chartjs-plugin-datalabels.min.js")
+
+    faces = []
+    for subset, unicode_range in SUBSETS.items():
+        for weight in WEIGHTS:
+            name = f"inter-{subset}-{weight}-normal.woff2"
+            download(f"{INTER}/{name}", name)
+            faces.append(
+                "@font-face {\n"
+                "  font-family: 'Inter';\n"
+                "  font-style: normal;\n"
+                f"  font-weight: {weight};\n"
+                "  font-display: swap;\n"
+                f"  src: url({name}) format('woff2');\n"
+                f"  unicode-range: {unicode_range};\n"
+                "}\n"
+            )
+    with open(os.path.join(VENDOR_DIR, "inter.css"), "w") as f:
+        f.write("\n".join(faces))
+    print("inter.css written")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except requests.RequestException as e:
+        print("ERROR:", e, file=sys.stderr)
+        sys.exit(1)
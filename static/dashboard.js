@@ -0,0 +1,410 @@
+// Префикс заведения (/имя) или пустая строка — см. data-base у <body>
+const BASE = document.body.dataset.base || '';
+// Ширина слота графика в минутах (/?resolution=15), уже проверенная сервером
+const RESOLUTION = document.body.dataset.resolution;
+const QUERY = RESOLUTION ? `?resolution=${RESOLUTION}` : '';
+let chart, pie;
+
+// Подписи слотов — "HH:MM"; слоты, которые ещё не начались, не рисуем
+function cutToNow(labels, arr){
+    const now = new Date();
+    const curMinute = now.getHours() * 60 + now.getMinutes();
+    let cutIndex = labels.findIndex(l => {
+        const [h, m] = l.split(':').map(Number);
+        return h * 60 + m > curMinute;
+    });
+    if(cutIndex === -1) cutIndex = labels.length;
+    return arr.slice(0, cutIndex);
+}
+
+// ==== Точечное обновление DOM ====
+// Дочерние элементы с data-key переиспользуются между обновлениями:
+// новые создаются, пропавшие удаляются, у остальных меняется только
+// изменившийся текст. Элементы без data-key (строка заголовка) остаются первыми.
+function setText(el, text){
+    text = String(text);
+    if(el.textContent !== text) el.textContent = text;
+}
+
+function patchChildren(parent, items, keyOf, create, update){
+    const existing = new Map();
+    let fixed = 0;
+    Array.from(parent.children).forEach(el=>{
+        if(el.dataset.key === undefined) fixed++;
+        else existing.set(el.dataset.key, el);
+    });
+    items.forEach((item, i)=>{
+        const key = String(keyOf(item));
+        let el = existing.get(key);
+        if(el) existing.delete(key);
+        else{
+            el = create();
+            el.dataset.key = key;
+        }
+        update(el, item);
+        const at = parent.children[fixed + i] || null;
+        if(at !== el) parent.insertBefore(el, at);
+    });
+    existing.forEach(el=>el.remove());
+}
+
+function tableBody(id, header){
+    const table = document.getElementById(id);
+    const body = table.tBodies[0] || table.appendChild(document.createElement('tbody'));
+    if(!body.querySelector('th')){
+        const tr = body.insertRow(0);
+        header.forEach(h=>{
+            const th = document.createElement('th');
+            th.textContent = h;
+            tr.appendChild(th);
+        });
+    }
+    return body;
+}
+
+function newRow(cells){
+    return ()=>{
+        const tr = document.createElement('tr');
+        for(let i = 0; i < cells; i++) tr.appendChild(document.createElement('td'));
+        return tr;
+    };
+}
+
+function patchRow(tr, values){
+    values.forEach((v, i)=>setText(tr.cells[i], v));
+}
+
+function newTile(){
+    const div = document.createElement('div');
+    div.innerHTML = '<div class="table-number"></div><div class="table-waiter"></div>';
+    return div;
+}
+
+function renderTables(zoneId, data){
+    patchChildren(document.getElementById(zoneId), data, t=>t.id, newTile, (el, t)=>{
+        const cls = "table-tile " + (t.occupied ? "occupied":"free");
+        if(el.className !== cls) el.className = cls;
+        setText(el.children[0], t.name);
+        setText(el.children[1], t.waiter);
+    });
+}
+
+// ==== УСТАРЕВШИЕ ДАННЫЕ ====
+// stale: {часть снимка: время последних удачных данных (сек), 0 — их не было}.
+// Каждая метка .stale смотрит на свои части из data-stale и показывает
+// самое старое время, пока хоть одна из них не обновилась.
+function renderStale(stale){
+    document.querySelectorAll('.stale').forEach(el=>{
+        const times = el.dataset.stale.split(' ').filter(p=>p in stale).map(p=>stale[p]);
+        if(!times.length){
+            if(!el.hidden) el.hidden = true;
+            return;
+        }
+        const since = Math.min(...times);
+        setText(el, since
+            ? '⚠ дані на ' + new Date(since * 1000).toLocaleTimeString('uk-UA',{hour:'2-digit',minute:'2-digit'})
+            : '⚠ немає зв\'язку');
+        if(el.hidden) el.hidden = false;
+    });
+}
+
+// ==== БРОНИРОВАНИЯ ====
+function bookingKey(b){
+    return `${b.time||''}|${b.name||''}|${b.guests??''}`;
+}
+
+function renderBookings(bookings){
+    const body = tableBody('bookings_tbl', ["Ім'я", 'Час', 'Кількість гостей']);
+    patchChildren(body, bookings||[], bookingKey, newRow(3),
+        (tr, b)=>patchRow(tr, [b.name||'', b.time||'', b.guests??'']));
+}
+
+async function refreshBookings(){
+    try{
+        const r = await fetch(BASE + '/api/bookings');
+        renderIfChanged('bookings', await r.text());
+    }catch(e){
+        // тихо игнорируем
+    }
+}
+
+function updateClock(){
+    const now = new Date();
+    document.getElementById('clock').innerText = now.toLocaleTimeString('uk-UA',{hour:'2-digit',minute:'2-digit'});
+}
+
+async function refresh(){
+    const r = await fetch(BASE + '/api/sales' + QUERY);
+    renderIfChanged('sales', await r.text());
+}
+
+// Граница полосы перцентилей: без линии и точек и без подписи в легенде.
+// fill — цвет заливки до предыдущего набора (нижней границы), '' — без заливки
+function band(fill){
+    return {
+        label:'',
+        data:[],
+        borderWidth: 0,
+        pointRadius: 0,
+        tension:0.4,
+        fill: fill ? '-1' : false,
+        backgroundColor: fill || 'transparent'
+    };
+}
+
+// Графики создаются один раз, дальше у них меняются только данные
+function createCharts(){
+    Chart.register(ChartDataLabels);
+
+    // Pie chart - компактный пирог с подписями внутри
+    const ctx2 = document.getElementById('pie').getContext('2d');
+    pie = new Chart(ctx2,{
+        type:'pie',
+        data:{
+            labels:['Гар.цех','Хол.цех','Бар'],
+            datasets:[{
+                data:[0,0,0],
+                backgroundColor:['#ff9500','#007aff','#af52de'],
+                borderWidth: 2,
+                borderColor: '#000'
+            }]
+        },
+        options:{
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins:{
+                legend:{display:false},
+                tooltip:{enabled:false},
+                datalabels:{
+                    color:'#fff',
+                    font:{weight:'bold', size:11, family:'Inter'},
+                    formatter:function(value, context){
+                        const label = context.chart.data.labels[context.dataIndex];
+                        return label + '\n' + value + '%';
+                    },
+                    textAlign: 'center'
+                }
+            }
+        }
+    });
+
+    // Line chart
+    const ctx = document.getElementById('chart').getContext('2d');
+    chart = new Chart(ctx,{
+        type:'line',
+        data:{
+            labels:[],
+            datasets:[
+                {
+                    label:'Гарячий',
+                    data:[],
+                    borderColor:'#ff9500',
+                    backgroundColor:'rgba(255, 149, 0, 0.1)',
+                    tension:0.4,
+                    fill:false,
+                    borderWidth: 2,
+                    pointRadius: 3,
+                    pointBackgroundColor: '#ff9500'
+                },
+                {
+                    label:'Холодний',
+                    data:[],
+                    borderColor:'#007aff',
+                    backgroundColor:'rgba(0, 122, 255, 0.1)',
+                    tension:0.4,
+                    fill:false,
+                    borderWidth: 2,
+                    pointRadius: 3,
+                    pointBackgroundColor: '#007aff'
+                },
+                {
+                    label:'Гарячий (мин. тиждн.)',
+                    data:[],
+                    borderColor:'rgba(255, 149, 0, 0.5)',
+                    borderDash:[6,4],
+                    tension:0.4,
+                    fill:false,
+                    borderWidth: 1,
+                    pointRadius: 2
+                },
+                {
+                    label:'Холодний (мин. тиждн.)',
+                    data:[],
+                    borderColor:'rgba(0, 122, 255, 0.5)',
+                    borderDash:[6,4],
+                    tension:0.4,
+                    fill:false,
+                    borderWidth: 1,
+                    pointRadius: 2
+                },
+                band(''), band('rgba(255, 149, 0, 0.12)'),
+                band(''), band('rgba(0, 122, 255, 0.12)')
+            ]
+        },
+        options:{
+            responsive:true,
+            maintainAspectRatio: false,
+            interaction: {
+                intersect: false,
+                mode: 'index'
+            },
+            plugins:{
+                legend:{
+                    labels:{
+                        filter: item => item.text !== '',
+                        color:'#8e8e93',
+                        font: { size: 9 },
+                        usePointStyle: true,
+                        pointStyle: 'circle'
+                    }
+                },
+                datalabels:{display:false}
+            },
+            scales:{
+                x:{
+                    ticks:{color:'#8e8e93', font: { size: 9 }},
+                    grid:{color:'rgba(142, 142, 147, 0.2)'},
+                    border:{color:'#38383a'}
+                },
+                y:{
+                    ticks:{color:'#8e8e93', font: { size: 9 }},
+                    grid:{color:'rgba(142, 142, 147, 0.2)'},
+                    border:{color:'#38383a'},
+                    beginAtZero:true
+                }
+            }
+        }
+    });
+
+}
+
+function categoryRows(id, today, prev, label){
+    const body = tableBody(id, ['Категорі', 'Сьогодні', label]);
+    setText(body.rows[0].cells[2], label);
+    const keys = [...new Set([...Object.keys(today), ...Object.keys(prev)])];
+    patchChildren(body, keys, k=>k, newRow(3), (tr, k)=>patchRow(tr, [k, today[k]||0, prev[k]||0]));
+}
+
+// Сравниваем со средним за несколько недель, а пока архив пуст — с неделей назад
+function baselineOf(data){
+    const b = data.baseline||{};
+    return b.weeks ? b : null;
+}
+
+function renderSales(data){
+    const base = baselineOf(data);
+    const label = base ? `Сер. ${base.weeks} тижн.` : 'Мин. тиждень';
+    categoryRows('hot_tbl', data.hot||{}, base ? base.hot||{} : data.hot_prev||{}, label);
+    categoryRows('cold_tbl', data.cold||{}, base ? base.cold||{} : data.cold_prev||{}, label);
+
+    if(!chart) createCharts();
+    const share = data.share||{};
+    pie.data.datasets[0].data = [share.hot||0, share.cold||0, share.bar||0];
+    pie.update('none');
+
+    const hourly = data.hourly||{};
+    const prev = base ? base.hourly||{} : data.hourly_prev||{};
+    const prevLabel = base ? `сер. ${base.weeks} тижн.` : 'мин. тиждн.';
+    const bands = base ? base.bands||{} : {};
+    const labels = hourly.labels||[];
+    const sets = chart.data.datasets;
+    chart.data.labels = labels;
+    sets[0].data = cutToNow(labels, hourly.hot||[]);
+    sets[1].data = cutToNow(labels, hourly.cold||[]);
+    sets[2].label = `Гарячий (${prevLabel})`;
+    sets[2].data = prev.hot||[];
+    sets[3].label = `Холодний (${prevLabel})`;
+    sets[3].data = prev.cold||[];
+    // Полоса p10–p90: нижняя граница и верхняя, залитая до нижней
+    sets[4].data = (bands.hot||{}).p10||[];
+    sets[5].data = (bands.hot||{}).p90||[];
+    sets[6].data = (bands.cold||{}).p10||[];
+    sets[7].data = (bands.cold||{}).p90||[];
+    chart.update('none');
+
+    updateClock();
+
+    // Update weather
+    const w = data.weather||{};
+    const iconEl = document.getElementById('weather-icon');
+    const src = w.icon ? `https://openweathermap.org/img/wn/${w.icon}@2x.png` : '';
+    const img = iconEl.querySelector('img');
+    if(!src){
+        if(img) iconEl.innerHTML = '';
+    }else if(!img){
+        iconEl.innerHTML = `<img src="${src}" alt="weather">`;
+    }else if(img.getAttribute('src') !== src){
+        img.setAttribute('src', src);
+    }
+
+    setText(document.getElementById('weather-temp'), w.temp || '—');
+    setText(document.getElementById('weather-desc'), w.desc || '—');
+
+    renderStale(data.stale||{});
+}
+
+function renderAllTables(data){
+    renderTables('hall', data.hall||[]);
+    renderTables('terrace', data.terrace||[]);
+}
+
+async function refreshTables(){
+    const r = await fetch(BASE + '/api/tables');
+    renderIfChanged('tables', await r.text());
+}
+
+// Одинаковый снимок (тот же JSON) повторно не разбираем и не рисуем
+const renderers = {sales: renderSales, tables: renderAllTables, bookings: renderBookings};
+const lastPayload = {};
+function renderIfChanged(channel, text){
+    if(lastPayload[channel] === text) return;
+    lastPayload[channel] = text;
+    renderers[channel](JSON.parse(text));
+}
+
+// Запасной вариант без SSE — периодический опрос, как раньше
+let polling = false;
+function startPolling(){
+    if(polling) return;
+    polling = true;
+    refresh();
+    refreshTables();
+    refreshBookings();
+    setInterval(refresh, 60000);
+    setInterval(refreshTables, 30000);
+    setInterval(refreshBookings, 60000);
+}
+
+// Сервер сам присылает изменившиеся снимки через /api/stream
+function startStream(){
+    if(!window.EventSource){
+        startPolling();
+        return;
+    }
+    const es = new EventSource(BASE + '/api/stream' + QUERY);
+    Object.keys(renderers).forEach(ch=>{
+        es.addEventListener(ch, ev=>{
+            try{ renderIfChanged(ch, ev.data); }catch(e){}
+        });
+    });
+    es.onerror = ()=>{
+        // Браузер переподключается сам; если поток закрыт совсем — опрашиваем
+        if(es.readyState === EventSource.CLOSED) startPolling();
+    };
+}
+
+// Снимки, встроенные сервером в страницу: таблицы уже отрисованы,
+// графики строим сразу, не дожидаясь первого события потока
+function renderInitial(){
+    const el = document.getElementById('initial-data');
+    if(!el) return;
+    try{
+        const snap = JSON.parse(el.textContent);
+        if(snap.sales) renderSales(snap.sales);
+    }catch(e){}
+}
+
+updateClock();
+setInterval(updateClock, 10000);
+renderInitial();
+startStream();